@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-from app.utils.conv import str_to_int
+from app.utils.conv import str_to_int, str_to_float
 
 # --- Пути и загрузка переменных окружения ---
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -12,22 +12,141 @@ load_dotenv(ENV_PATH)
 DEFAULTS = {
     'IMAGE_SIZE': 320,
     'TEST_VIDEO_PATH': 'vpr_data/IMG_0798.MOV',
+    'SCENES_DIR': 'data/scenes/',
+    'SCENES_METADATA_PATH': 'data/scenes_metadata.csv',
+    'DINOV2_HUB_DIR': '',
     'REDIS_HOST': 'localhost',
     'REDIS_PORT': 6379,
+    'FFMPEG_PATH': 'ffmpeg',
+    'JOB_WORKERS': 2,
+    'JOB_QUEUE_SIZE': 8,
+    'JOB_HISTORY_SIZE': 100,
+    'SESSION_FILTER_WINDOW': 5,
+    'DECODE_WORKERS': 4,
+    'MAX_BATCH_IMAGES': 64,
+    'GEO_CELL_DEG': 0.01,
+    'PROFILE_TOKEN': '',
+    'PROFILE_DIR': '/tmp/vpe_profiles',
+    'WARMUP_ITERATIONS': 2,
+    'INDEX_MODE': 'local',
+    'INDEX_ARTIFACT_DIR': 'data/index',
+    'INDEX_SHARDS': 0,
+    'INDEX_SHARD_ADDRESSES': '',
+    'INDEX_SHARD_AUTHKEY': '',
+    'PRELOAD_MODEL': 0,
+    'MODEL_SEED': 0,
+    'CONSOLIDATE_MAX_PER_SCENE': 0,
+    'CONSOLIDATE_RERANK': 1,
+    'RESULT_CACHE_SIZE': 256,
+    'RESULT_CACHE_TTL': 3600,
+    'EMBEDDING_CACHE_SIZE': 2048,
+    'EMBEDDING_CACHE_TTL': 3600,
 }
 
 # --- Конфигурация с загрузкой из окружения и fallback на DEFAULTS ---
 IMAGE_SIZE = str_to_int(os.getenv('IMAGE_SIZE'), DEFAULTS['IMAGE_SIZE'])
 TEST_VIDEO_PATH = os.getenv('TEST_VIDEO_PATH', DEFAULTS['TEST_VIDEO_PATH'])
+SCENES_DIR = os.getenv('SCENES_DIR', DEFAULTS['SCENES_DIR'])
+SCENES_METADATA_PATH = os.getenv('SCENES_METADATA_PATH', DEFAULTS['SCENES_METADATA_PATH'])
+DINOV2_HUB_DIR = os.getenv('DINOV2_HUB_DIR', DEFAULTS['DINOV2_HUB_DIR'])
 REDIS_HOST = os.getenv('REDIS_HOST', DEFAULTS['REDIS_HOST'])
 REDIS_PORT = str_to_int(os.getenv('REDIS_PORT'), DEFAULTS['REDIS_PORT'])
+FFMPEG_PATH = os.getenv('FFMPEG_PATH', DEFAULTS['FFMPEG_PATH'])
+JOB_WORKERS = str_to_int(os.getenv('JOB_WORKERS'), DEFAULTS['JOB_WORKERS'])
+JOB_QUEUE_SIZE = str_to_int(os.getenv('JOB_QUEUE_SIZE'), DEFAULTS['JOB_QUEUE_SIZE'])
+JOB_HISTORY_SIZE = str_to_int(os.getenv('JOB_HISTORY_SIZE'), DEFAULTS['JOB_HISTORY_SIZE'])
+SESSION_FILTER_WINDOW = str_to_int(os.getenv('SESSION_FILTER_WINDOW'), DEFAULTS['SESSION_FILTER_WINDOW'])
+DECODE_WORKERS = str_to_int(os.getenv('DECODE_WORKERS'), DEFAULTS['DECODE_WORKERS'])
+MAX_BATCH_IMAGES = str_to_int(os.getenv('MAX_BATCH_IMAGES'), DEFAULTS['MAX_BATCH_IMAGES'])
+GEO_CELL_DEG = str_to_float(os.getenv('GEO_CELL_DEG'), DEFAULTS['GEO_CELL_DEG'])
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', DEFAULTS['PROFILE_TOKEN'])
+PROFILE_DIR = os.getenv('PROFILE_DIR', DEFAULTS['PROFILE_DIR'])
+WARMUP_ITERATIONS = str_to_int(os.getenv('WARMUP_ITERATIONS'), DEFAULTS['WARMUP_ITERATIONS'])
+INDEX_MODE = os.getenv('INDEX_MODE', DEFAULTS['INDEX_MODE'])
+INDEX_ARTIFACT_DIR = os.getenv('INDEX_ARTIFACT_DIR', DEFAULTS['INDEX_ARTIFACT_DIR'])
+INDEX_SHARDS = str_to_int(os.getenv('INDEX_SHARDS'), DEFAULTS['INDEX_SHARDS'])
+INDEX_SHARD_ADDRESSES = os.getenv('INDEX_SHARD_ADDRESSES', DEFAULTS['INDEX_SHARD_ADDRESSES'])
+INDEX_SHARD_AUTHKEY = os.getenv('INDEX_SHARD_AUTHKEY', DEFAULTS['INDEX_SHARD_AUTHKEY'])
+PRELOAD_MODEL = bool(str_to_int(os.getenv('PRELOAD_MODEL'), DEFAULTS['PRELOAD_MODEL']))
+MODEL_SEED = str_to_int(os.getenv('MODEL_SEED'), DEFAULTS['MODEL_SEED'])
+CONSOLIDATE_MAX_PER_SCENE = str_to_int(os.getenv('CONSOLIDATE_MAX_PER_SCENE'), DEFAULTS['CONSOLIDATE_MAX_PER_SCENE'])
+CONSOLIDATE_RERANK = bool(str_to_int(os.getenv('CONSOLIDATE_RERANK'), DEFAULTS['CONSOLIDATE_RERANK']))
+RESULT_CACHE_SIZE = str_to_int(os.getenv('RESULT_CACHE_SIZE'), DEFAULTS['RESULT_CACHE_SIZE'])
+RESULT_CACHE_TTL = str_to_float(os.getenv('RESULT_CACHE_TTL'), DEFAULTS['RESULT_CACHE_TTL'])
+EMBEDDING_CACHE_SIZE = str_to_int(os.getenv('EMBEDDING_CACHE_SIZE'), DEFAULTS['EMBEDDING_CACHE_SIZE'])
+EMBEDDING_CACHE_TTL = str_to_float(os.getenv('EMBEDDING_CACHE_TTL'), DEFAULTS['EMBEDDING_CACHE_TTL'])
 
 # --- Словарь конфигурации для удобного доступа ---
 CONFIG = {
     'image_size': IMAGE_SIZE,
     'test_video_path': TEST_VIDEO_PATH,
+    'scenes_dir': SCENES_DIR,
+    'scenes_metadata_path': SCENES_METADATA_PATH,
+    'model': {
+        'dinov2_hub_dir': DINOV2_HUB_DIR,
+        'warmup_iterations': WARMUP_ITERATIONS,
+        # Загрузка модели до fork (gunicorn --preload): веса разделяются воркерами
+        'preload': PRELOAD_MODEL,
+        'seed': MODEL_SEED,
+    },
+    # local — каждый процесс строит индекс сам;
+    # shared — индекс строится один раз и подключается всеми воркерами через mmap
+    #          (перестраивается, если набор сцен изменился);
+    # artifact — подключается только готовый артефакт из build_index.py.
+    # shards > 1 — дескрипторы распределяются по локальным процессам-шардам;
+    # shard_addresses ("host:port,...") — вместо них используются удалённые шарды;
+    # удалённый шард обслуживает одного координатора, поэтому gunicorn с ними
+    # запускает один воркер;
+    # shard_authkey — общий ключ координатора и шардов, для удалённых шардов обязателен
+    'index': {
+        'mode': INDEX_MODE,
+        'artifact_dir': INDEX_ARTIFACT_DIR,
+        'shards': INDEX_SHARDS,
+        'shard_addresses': INDEX_SHARD_ADDRESSES,
+        'shard_authkey': INDEX_SHARD_AUTHKEY,
+    },
+    # Консолидация при построении индекса: в поиск попадает не более max_per_scene
+    # медоидов на сцену (0 — все дескрипторы); при rerank найденные сцены
+    # переранжируются по исходным дескрипторам, которые процесс держит в памяти
+    # (только для индекса, построенного самим процессом; артефакт их не содержит)
+    'consolidation': {
+        'max_per_scene': CONSOLIDATE_MAX_PER_SCENE,
+        'rerank': CONSOLIDATE_RERANK,
+    },
     'redis': {
         'host': REDIS_HOST,
         'port': REDIS_PORT,
-    }
+    },
+    'stream': {
+        'ffmpeg_path': FFMPEG_PATH,
+    },
+    'jobs': {
+        'workers': JOB_WORKERS,
+        'queue_size': JOB_QUEUE_SIZE,
+        'history_size': JOB_HISTORY_SIZE,
+    },
+    'session': {
+        'filter_window': SESSION_FILTER_WINDOW,
+    },
+    'batch': {
+        'decode_workers': DECODE_WORKERS,
+        'max_images': MAX_BATCH_IMAGES,
+    },
+    'geo': {
+        'cell_deg': GEO_CELL_DEG,
+    },
+    # Размер 0 отключает кэш, TTL задаётся в секундах (0 — без ограничения).
+    # result — результаты /process-video/ по хэшу содержимого загрузки,
+    # embedding — дескрипторы кадров по перцептивному хэшу
+    'cache': {
+        'result_size': RESULT_CACHE_SIZE,
+        'result_ttl': RESULT_CACHE_TTL,
+        'embedding_size': EMBEDDING_CACHE_SIZE,
+        'embedding_ttl': EMBEDDING_CACHE_TTL,
+    },
+    # Профилирование запросов включено, только если задан PROFILE_TOKEN
+    'profiling': {
+        'token': PROFILE_TOKEN,
+        'dir': PROFILE_DIR,
+    },
 }
\ No newline at end of file
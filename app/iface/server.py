@@ -1,27 +1,71 @@
 import asyncio
+import hashlib
+import hmac
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
 
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request, UploadFile, File, Form, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, HTMLResponse, Response, FileResponse
 from fastapi.staticfiles import StaticFiles
-import shutil
 import os
 import uuid
 
 from fastapi.middleware.cors import CORSMiddleware
 from ..usecase.vpr.vpr import VPRSystem
 from ..usecase.vpe.vpe import VPEProcessor
+from ..usecase.vpr.artifact import artifact_exists, artifact_lock, entries_digest, read_manifest
+from ..usecase.video_processor.stream_decoder import StreamVideoDecoder
+from ..usecase.jobs.job_queue import Job, JobCancelledError, JobQueue, JobStatus, QueueFullError
+from ..usecase.session.localization_session import LocalizationSession
+from ..usecase.profiling.profiler import PROFILE_SCOPE, ProfilerBusyError, RequestProfiler
+from ..usecase.cache.cache import TTLCache
+from ..usecase.warmup.startup import (
+    StartupState, STAGE_LOADING_SCENES, STAGE_LOADING_MODEL, STAGE_BUILDING_INDEX,
+    STAGE_ATTACHING_INDEX, STAGE_WARMUP,
+)
+from ..utils.image import bytes_to_image
+from ..usecase.metrics.metrics import (
+    CONTENT_TYPE_LATEST, HTTP_LATENCY, JOB_QUEUE_DEPTH, SESSION_FRAMES, render_metrics,
+)
+from ..config.config import CONFIG
+
+# Размер порции при сохранении загруженного видео
+UPLOAD_CHUNK = 1024 * 1024
 
 
 class VPEServer:
-    def __init__(self, scenes):
+    def __init__(self, load_scenes: Callable[[], List[Dict[str, Any]]]):
         """
-        Инициализирует сервер VPE, включая систему распознавания мест (VPR),
-        построение индекса и маршруты API.
+        Инициализирует сервер VPE и маршруты API.
+
+        Загрузка сцен, модели, построение индекса и прогрев выполняются в фоновом
+        потоке после старта приложения, поэтому сервер сразу начинает принимать
+        соединения. Ход инициализации доступен через /healthz и /readyz.
+
+        :param load_scenes: функция, возвращающая записи сцен для индексации
         """
-        self.vpr = VPRSystem()
-        self.vpr.build_index(scenes)
+        self.load_scenes = load_scenes
+        self.state = StartupState()
+        self.vpr: Optional[VPRSystem] = None
+        self.processor: Optional[VPEProcessor] = None
+
+        # При запуске под gunicorn --preload модель загружается до fork,
+        # и воркеры разделяют её веса по copy-on-write
+        self._preloaded_vpr = VPRSystem() if CONFIG["model"]["preload"] else None
+
+        jobs_cfg = CONFIG["jobs"]
+        self.jobs = JobQueue(jobs_cfg["workers"], jobs_cfg["queue_size"], jobs_cfg["history_size"])
+        JOB_QUEUE_DEPTH.set_function(lambda: self.jobs.depth)
+
+        self.profiler = RequestProfiler(CONFIG["profiling"]["dir"])
+
+        # Результаты обработки видео по хэшу содержимого: повторная загрузка
+        # того же файла отвечается без обработки
+        cache_cfg = CONFIG["cache"]
+        self.result_cache = TTLCache("result", cache_cfg["result_size"], cache_cfg["result_ttl"])
 
-        self.processor = VPEProcessor(self.vpr)
         self.app = FastAPI(title="VPE Server")
 
         self.app.add_middleware(
@@ -37,7 +81,127 @@ class VPEServer:
         # Подключение статики (CSS, JS, изображения)
         self.app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
+        @self.app.on_event("startup")
+        async def start_initialization():
+            # Обработчики очереди запускаются здесь, а не в конструкторе: при
+            # gunicorn --preload конструктор выполняется в мастере до fork
+            self.jobs.start()
+            threading.Thread(target=self._initialize, name="vpe-init", daemon=True).start()
+
+    def _initialize(self):
+        """Фоновая инициализация: сцены, модель, индекс и прогрев модели."""
+        try:
+            self.state.set_stage(STAGE_LOADING_MODEL)
+            vpr = self._preloaded_vpr or VPRSystem()
+
+            mode = CONFIG["index"]["mode"]
+            if mode == "artifact":
+                self._attach_prebuilt_index(vpr)
+            elif mode == "shared":
+                self._attach_shared_index(vpr)
+            else:
+                self._build_index(vpr)
+
+            iterations = CONFIG["model"]["warmup_iterations"]
+            if iterations > 0:
+                self.state.set_stage(STAGE_WARMUP, total=iterations)
+                for i in range(iterations):
+                    vpr.warmup(1)
+                    self.state.set_progress(i + 1)
+
+            self.vpr = vpr
+            self.processor = VPEProcessor(vpr, scenes_dir=CONFIG["scenes_dir"])
+            self.state.mark_ready()
+        except Exception as e:
+            self.state.mark_failed(str(e))
+
+    def _build_index(self, vpr: VPRSystem, scenes: Optional[List[Dict[str, Any]]] = None):
+        if scenes is None:
+            self.state.set_stage(STAGE_LOADING_SCENES)
+            scenes = self.load_scenes()
+
+        self.state.set_stage(STAGE_BUILDING_INDEX, total=len(scenes))
+        vpr.build_index(scenes, on_progress=self.state.set_progress)
+
+    def _attach_shared_index(self, vpr: VPRSystem):
+        """
+        Подключает общий индекс из артефакта. Если артефакта ещё нет или он построен
+        по другому набору сцен, его (пере)строит первый захвативший блокировку процесс,
+        остальные ждут и подключаются к результату.
+        """
+        path = CONFIG["index"]["artifact_dir"]
+        self.state.set_stage(STAGE_LOADING_SCENES)
+        scenes = self.load_scenes()
+        digest = entries_digest(scenes)
+
+        with artifact_lock(path):
+            stale = artifact_exists(path) and read_manifest(path).get("entries_digest") != digest
+            if stale:
+                print(f"♻️ Артефакт {path} построен по другому набору сцен, перестраиваем")
+            if stale or not artifact_exists(path):
+                self._build_index(vpr, scenes)
+                vpr.save_artifact(path, entries_digest=digest)
+
+            self.state.set_stage(STAGE_ATTACHING_INDEX)
+            vpr.attach_artifact(path)
+
+    def _attach_prebuilt_index(self, vpr: VPRSystem):
+        """
+        Подключает артефакт, построенный заранее (build_index.py); сервер индекс не строит.
+        Если доступные серверу сцены отличаются от тех, по которым построен артефакт,
+        выводится предупреждение.
+        """
+        path = CONFIG["index"]["artifact_dir"]
+        if not artifact_exists(path):
+            raise FileNotFoundError(f"Артефакт индекса не найден: {path}. Постройте его: python build_index.py")
+
+        self.state.set_stage(STAGE_LOADING_SCENES)
+        scenes = self.load_scenes()
+        if scenes and read_manifest(path).get("entries_digest") != entries_digest(scenes):
+            print(f"⚠️ Артефакт {path} построен по другому набору сцен; перестройте его: python build_index.py")
+
+        self.state.set_stage(STAGE_ATTACHING_INDEX)
+        vpr.attach_artifact(path)
+
+    def _not_ready(self) -> JSONResponse:
+        return JSONResponse(status_code=503, content={"error": "Сервис ещё не готов", **self.state.to_dict()})
+
     def _setup_routes(self):
+        @self.app.middleware("http")
+        async def record_latency(request: Request, call_next):
+            """Записывает время обработки каждого HTTP-запроса по шаблону маршрута."""
+            started = time.perf_counter()
+            response = await call_next(request)
+            route = request.scope.get("route")
+            HTTP_LATENCY.labels(
+                request.method, route.path if route else "unmatched", str(response.status_code),
+            ).observe(time.perf_counter() - started)
+            return response
+
+        @self.app.get("/healthz")
+        async def liveness():
+            """Проба живости: процесс запущен и обрабатывает запросы."""
+            return JSONResponse(content={"status": "alive"})
+
+        @self.app.get("/readyz")
+        async def readiness():
+            """Проба готовности: модель загружена, индекс построен, прогрев завершён."""
+            return JSONResponse(status_code=200 if self.state.ready else 503, content=self.state.to_dict())
+
+        @self.app.get("/metrics")
+        async def metrics():
+            """Отдаёт метрики в формате Prometheus."""
+            return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+        @self.app.get("/cache/stats")
+        async def cache_stats():
+            """Возвращает заполненность и долю попаданий кэшей результатов и эмбеддингов."""
+            content = {"result": self.result_cache.stats()}
+            if self.vpr is not None:
+                content["embedding"] = self.vpr.embedding_cache.stats()
+                content["index_version"] = self.vpr.index_version
+            return JSONResponse(content=content)
+
         @self.app.get("/", response_class=HTMLResponse)
         async def index():
             """Отображает главную HTML-страницу."""
@@ -49,31 +213,430 @@ class VPEServer:
                 return HTMLResponse(status_code=500, content="<h1>500 — Файл index.html не найден</h1>")
 
         @self.app.post("/process-video/")
-        async def process_video(file: UploadFile = File(...)):
+        async def process_video(request: Request, file: UploadFile = File(...)):
             """
             Обрабатывает загруженное видео, выполняет распознавание местоположения по кадрам.
+            Обработка выполняется через общую очередь задач и ожидается в рамках запроса.
+
+            С заголовками "X-Profile: 1" и "X-Profile-Token" для запроса снимается профиль,
+            доступный затем по /profiles/{profile_id}. Профиль снимается не более чем для
+            одного запроса процесса за раз, остальные профилируемые запросы получают 409.
             """
-            temp_filename = f"/tmp/{uuid.uuid4()}_{file.filename}"
+            if not self.state.ready:
+                return self._not_ready()
+            try:
+                job = await self._submit_video(file, self._profiling_requested(request))
+            except PermissionError as e:
+                return JSONResponse(status_code=403, content={"error": str(e)})
+            except ProfilerBusyError as e:
+                return JSONResponse(status_code=409, content={"error": str(e)})
+            except QueueFullError as e:
+                return JSONResponse(status_code=429, content={"error": str(e)})
+            except Exception as e:
+                return JSONResponse(status_code=500, content={"error": str(e)})
 
+            await self._wait_job(job)
+
+            if job.status != JobStatus.DONE:
+                return JSONResponse(status_code=500, content={"error": job.error or job.status.value})
+
+            print("✅ Результаты анализа:", job.results)
+            content = {"results": job.results}
+            if job.profiled:
+                content["profile_id"] = job.job_id
+            return JSONResponse(content=content)
+
+        @self.app.post("/jobs", status_code=202)
+        async def submit_job(request: Request, file: UploadFile = File(...)):
+            """
+            Ставит видео в очередь на обработку и сразу возвращает идентификатор задачи.
+            Поддерживает те же заголовки профилирования, что и /process-video/.
+            """
+            if not self.state.ready:
+                return self._not_ready()
             try:
-                # Сохраняем видео во временный файл
-                with open(temp_filename, "wb") as buf:
-                    shutil.copyfileobj(file.file, buf)
+                job = await self._submit_video(file, self._profiling_requested(request))
+            except PermissionError as e:
+                return JSONResponse(status_code=403, content={"error": str(e)})
+            except ProfilerBusyError as e:
+                return JSONResponse(status_code=409, content={"error": str(e)})
+            except QueueFullError as e:
+                return JSONResponse(status_code=429, content={"error": str(e)})
+            except Exception as e:
+                return JSONResponse(status_code=500, content={"error": str(e)})
 
-                # Обрабатываем видео
-                results = await asyncio.to_thread(self.processor.process_video, temp_filename)
+            return JSONResponse(status_code=202, content=job.to_dict())
 
-                # results = self.processor.process_video(temp_filename)
-                print("✅ Результаты анализа:", results)
+        @self.app.get("/jobs/{job_id}")
+        async def job_status(job_id: str):
+            """Возвращает статус и прогресс задачи (обработано кадров / всего)."""
+            job = self.jobs.get(job_id)
+            if job is None:
+                return JSONResponse(status_code=404, content={"error": "Задача не найдена"})
+            return JSONResponse(content={**job.to_dict(), "queue_depth": self.jobs.depth})
 
-                return JSONResponse(content={"results": results})
+        @self.app.get("/jobs/{job_id}/results")
+        async def job_results(job_id: str):
+            """Возвращает результаты завершённой задачи."""
+            job = self.jobs.get(job_id)
+            if job is None:
+                return JSONResponse(status_code=404, content={"error": "Задача не найдена"})
+            if job.status != JobStatus.DONE:
+                return JSONResponse(status_code=409, content=job.to_dict())
+            return JSONResponse(content={"results": job.results})
+
+        @self.app.delete("/jobs/{job_id}")
+        async def cancel_job(job_id: str):
+            """Отменяет задачу в очереди или прерывает выполняющуюся."""
+            job = self.jobs.cancel(job_id)
+            if job is None:
+                return JSONResponse(status_code=404, content={"error": "Задача не найдена"})
+            return JSONResponse(content=job.to_dict())
+
+        @self.app.get("/profiles/{request_id}")
+        async def list_profile(request: Request, request_id: str):
+            """Возвращает список артефактов профиля запроса."""
+            if not self._profiling_authorized(request):
+                return JSONResponse(status_code=403, content={"error": "Доступ запрещён"})
+            artifacts = self.profiler.list_artifacts(request_id)
+            if not artifacts:
+                return JSONResponse(status_code=404, content={"error": "Профиль не найден"})
+            return JSONResponse(content={"request_id": request_id, "artifacts": artifacts, "scope": PROFILE_SCOPE})
+
+        @self.app.get("/profiles/{request_id}/{artifact}")
+        async def get_profile_artifact(request: Request, request_id: str, artifact: str):
+            """Отдаёт файл артефакта профиля (python.prof, python.txt, torch_ops.txt, torch_trace.json)."""
+            if not self._profiling_authorized(request):
+                return JSONResponse(status_code=403, content={"error": "Доступ запрещён"})
+            path = self.profiler.artifact_path(request_id, artifact)
+            if path is None:
+                return JSONResponse(status_code=404, content={"error": "Артефакт не найден"})
+            return FileResponse(path, filename=artifact)
+
+        @self.app.post("/recognize-images")
+        async def recognize_images(files: List[UploadFile] = File(...), verify: bool = Form(False),
+                                   lat: Optional[float] = Form(None), lon: Optional[float] = Form(None),
+                                   radius_m: Optional[float] = Form(None)):
+            """
+            Пакетное распознавание мест по фотографиям: изображения декодируются параллельно,
+            дескрипторы вычисляются батчами, поиск по индексу выполняется одним запросом.
+            При verify=true результаты проверяются гомографией. Если переданы lat, lon
+            и radius_m, поиск ограничивается сценами в этом радиусе.
+            """
+            if not self.state.ready:
+                return self._not_ready()
+            batch_cfg = CONFIG["batch"]
+            if len(files) > batch_cfg["max_images"]:
+                return JSONResponse(
+                    status_code=413,
+                    content={"error": f"Слишком много изображений: максимум {batch_cfg['max_images']}"},
+                )
+
+            location = (lat, lon) if lat is not None and lon is not None else None
+            payloads = [await file.read() for file in files]
+
+            def decode(data: bytes):
+                try:
+                    return bytes_to_image(data), None
+                except ValueError as e:
+                    return None, str(e)
+
+            def run():
+                with ThreadPoolExecutor(max_workers=batch_cfg["decode_workers"]) as pool:
+                    decoded = list(pool.map(decode, payloads))
+
+                images = [img for img, _ in decoded if img is not None]
+                found = iter(self.processor.recognize_images(
+                    images, verify, batch_cfg["decode_workers"], location, radius_m,
+                ))
+                return [(next(found) if img is not None else None, error) for img, error in decoded]
+
+            try:
+                recognized = await asyncio.to_thread(run)
             except Exception as e:
                 return JSONResponse(status_code=500, content={"error": str(e)})
 
+            results = []
+            for file, (place, error) in zip(files, recognized):
+                item = {"filename": file.filename, "result": place}
+                if error:
+                    item["error"] = error
+                results.append(item)
+
+            return JSONResponse(content={"results": results})
+
+        @self.app.get("/scenes/near")
+        async def scenes_near(lat: float = Query(...), lon: float = Query(...),
+                              radius_m: float = Query(1000.0, ge=0)):
+            """Возвращает сцены в радиусе radius_m метров от точки, ближайшие первыми."""
+            if not self.state.ready:
+                return self._not_ready()
+            scenes = await asyncio.to_thread(self.vpr.scenes_near, lat, lon, radius_m)
+            return JSONResponse(content={"scenes": [
+                {**metadata.__dict__, "distance_m": round(dist, 2)} for metadata, dist in scenes
+            ]})
+
+        @self.app.websocket("/ws/process-video")
+        async def process_video_stream(websocket: WebSocket):
+            """
+            Потоковая обработка видео: клиент отправляет видео бинарными сообщениями
+            по мере чтения файла и текстовое сообщение "end" в конце. Декодирование
+            начинается до окончания загрузки, а каждое подтверждённое место отправляется
+            клиенту сразу: {"event": "place", ...}. Поток завершается событием
+            {"event": "done"} или {"event": "error", "error": ...}.
+
+            Обработка ставится в общую очередь задач; если очередь заполнена,
+            соединение закрывается с кодом 1013.
+            """
+            await websocket.accept()
+            if not self.state.ready:
+                await websocket.close(code=1013)
+                return
+
+            loop = asyncio.get_running_loop()
+            events: asyncio.Queue = asyncio.Queue()
+            decoder = StreamVideoDecoder(self.processor.frame_step)
+
+            def emit(event: dict):
+                loop.call_soon_threadsafe(events.put_nowait, event)
+
+            def recognize(job: Job):
+                places = []
+                try:
+                    for result in self.processor.process_frames(decoder.frames(), job):
+                        places.append(result)
+                        emit({"event": "place", **result})
+                    # Отключение клиента закрывает декодер, и кадры заканчиваются досрочно
+                    job.check_cancelled()
+                except JobCancelledError:
+                    raise
+                except Exception as e:
+                    emit({"event": "error", "error": str(e)})
+                    raise
+                emit({"event": "done"})
+                return places
+
+            # Распознавание выполняется в общей очереди задач, как и /process-video/:
+            # число одновременно работающих конвейеров ограничено её обработчиками
+            try:
+                decoder.start()
+            except Exception as e:
+                # Например, ffmpeg не установлен: клиент получает событие ошибки, а не обрыв 1011
+                decoder.close()
+                await websocket.send_json({"event": "error", "error": f"Не удалось запустить декодер: {e}"})
+                await websocket.close()
+                return
+
+            try:
+                job = self.jobs.submit(recognize)
+            except QueueFullError:
+                decoder.close()
+                await websocket.close(code=1013)
+                return
+
+            async def feed_upload():
+                try:
+                    while True:
+                        message = await websocket.receive()
+                        if message["type"] == "websocket.disconnect":
+                            events.put_nowait({"event": "disconnect"})
+                            break
+                        if message.get("bytes"):
+                            if not await asyncio.to_thread(decoder.feed, message["bytes"]):
+                                break
+                        elif message.get("text") == "end":
+                            break
+                finally:
+                    await asyncio.to_thread(decoder.close_input)
+
+            feeder = asyncio.create_task(feed_upload())
+
+            try:
+                while True:
+                    event = await events.get()
+                    if event["event"] == "disconnect":
+                        return
+                    await websocket.send_json(event)
+                    if event["event"] != "place":
+                        break
+                await websocket.close()
+            finally:
+                feeder.cancel()
+                self.jobs.cancel(job.job_id)
+                decoder.close()
+                await self._wait_job(job)
+
+        @self.app.websocket("/ws/localize")
+        async def localize_session(websocket: WebSocket):
+            """
+            Сессия локализации в реальном времени: клиент отправляет отдельные кадры
+            камеры (JPEG/PNG) бинарными сообщениями и получает сглаженную позицию
+            для каждого обработанного кадра: {"event": "position", ...}.
+
+            Если кадры приходят быстрее, чем выполняется распознавание, обрабатывается
+            только самый свежий кадр, а устаревшие отбрасываются. Текстовое сообщение
+            "reset" сбрасывает историю позиций сессии.
+            """
+            await websocket.accept()
+            if not self.state.ready:
+                await websocket.close(code=1013)
+                return
+
+            session = LocalizationSession(self.vpr, CONFIG["session"]["filter_window"])
+            await websocket.send_json({"event": "session", **session.stats()})
+
+            # Слот для последнего непринятого в обработку кадра
+            pending = {"frame": None, "reset": False}
+            wakeup = asyncio.Event()
+
+            async def receive_frames():
+                try:
+                    while True:
+                        message = await websocket.receive()
+                        if message["type"] == "websocket.disconnect":
+                            break
+                        if message.get("bytes"):
+                            session.frames_received += 1
+                            if pending["frame"] is not None:
+                                session.frames_dropped += 1
+                                SESSION_FRAMES.labels("dropped").inc()
+                            pending["frame"] = (session.frames_received, message["bytes"], time.perf_counter())
+                            wakeup.set()
+                        elif message.get("text") == "reset":
+                            pending["reset"] = True
+                finally:
+                    wakeup.set()
+
+            def localize(seq: int, data: bytes) -> dict:
+                if pending["reset"]:
+                    pending["reset"] = False
+                    session.reset()
+                try:
+                    return session.localize(bytes_to_image(data), seq)
+                except ValueError as e:
+                    return {"seq": seq, "error": str(e)}
+
+            receiver = asyncio.create_task(receive_frames())
+            try:
+                while True:
+                    await wakeup.wait()
+                    wakeup.clear()
+                    if receiver.done():
+                        break
+                    if pending["frame"] is None:
+                        continue
+
+                    seq, data, received_at = pending["frame"]
+                    pending["frame"] = None
+
+                    result = await asyncio.to_thread(localize, seq, data)
+                    SESSION_FRAMES.labels("processed").inc()
+                    result["latency_ms"] = round((time.perf_counter() - received_at) * 1000, 2)
+                    result["frames_dropped"] = session.frames_dropped
+                    await websocket.send_json({"event": "position", **result})
+            except WebSocketDisconnect:
+                pass
             finally:
-                # Удаляем временный файл в любом случае
-                if os.path.exists(temp_filename):
-                    os.remove(temp_filename)
+                receiver.cancel()
+
+    @staticmethod
+    def _profiling_authorized(request: Request) -> bool:
+        """Проверяет токен профилирования; без PROFILE_TOKEN профилирование выключено."""
+        token = CONFIG["profiling"]["token"]
+        provided = request.headers.get("X-Profile-Token", "")
+        return bool(token) and hmac.compare_digest(provided.encode(), token.encode())
+
+    def _profiling_requested(self, request: Request) -> bool:
+        """
+        Определяет, запрошено ли профилирование запроса заголовком X-Profile.
+
+        :raises PermissionError: если профилирование запрошено без корректного токена
+        """
+        if request.headers.get("X-Profile") != "1":
+            return False
+        if not self._profiling_authorized(request):
+            raise PermissionError("Профилирование недоступно: неверный токен")
+        return True
+
+    @staticmethod
+    async def _wait_job(job: Job) -> None:
+        """
+        Ожидает завершения задачи без блокировки потока: future завершается из
+        обработчика завершения задачи. Ожидание через to_thread занимало бы поток
+        пула по умолчанию на всё время задачи и могло исчерпать пул.
+        """
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def resolve():
+            if not finished.done():
+                finished.set_result(None)
+
+        job.add_done_callback(lambda _job: loop.call_soon_threadsafe(resolve))
+        await finished
+
+    async def _submit_video(self, file: UploadFile, profile: bool = False) -> Job:
+        """
+        Сохраняет загруженное видео во временный файл и ставит его обработку в очередь.
+        Временный файл удаляется после завершения задачи в любом статусе.
+        При profile=True обработка выполняется под профилировщиком, артефакты
+        сохраняются под идентификатором задачи. Профилировщик занимается до постановки
+        в очередь и освобождается по завершении задачи в любом статусе.
+
+        Если такое же видео уже обрабатывалось с текущим индексом, возвращается
+        завершённая задача с результатами из кэша (кроме запросов с профилированием).
+
+        :raises QueueFullError: если очередь заполнена
+        :raises ProfilerBusyError: если профиль уже снимается для другого запроса
+        """
+        # Проверяем заполненность заранее, чтобы не сохранять видео впустую
+        if self.jobs.is_full():
+            raise QueueFullError("Очередь задач заполнена")
+        if profile:
+            self.profiler.reserve()
+
+        temp_filename = f"/tmp/{uuid.uuid4()}_{os.path.basename(file.filename or 'video')}"
+
+        content_hash = hashlib.sha256()
+
+        def save():
+            # Хэш содержимого считается при записи, без повторного чтения файла
+            with open(temp_filename, "wb") as buf:
+                for chunk in iter(lambda: file.file.read(UPLOAD_CHUNK), b""):
+                    content_hash.update(chunk)
+                    buf.write(chunk)
+
+        def cleanup(_job: Job):
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            if profile:
+                self.profiler.release()
+
+        cache_key = None
+
+        def task(job: Job):
+            if not profile:
+                results = self.processor.process_video(temp_filename, job)
+                self.result_cache.put(cache_key, results)
+                return results
+            with self.profiler.profile(job.job_id):
+                return self.processor.process_video(temp_filename, job)
+
+        try:
+            await asyncio.to_thread(save)
+
+            cache_key = (content_hash.hexdigest(), self.processor.frame_step, self.vpr.index_version)
+            cached = None if profile else self.result_cache.get(cache_key)
+            if cached is not None:
+                cleanup(None)
+                return self.jobs.add_completed(cached)
+
+            job = self.jobs.submit(task, on_finish=cleanup)
+            job.profiled = profile
+            return job
+        except Exception:
+            cleanup(None)
+            raise
 
     def get_app(self) -> FastAPI:
         """
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.usecase.metrics.metrics import CACHE_REQUESTS
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш с ограничением числа записей и временем жизни записи.
+
+    При переполнении вытесняется запись, к которой дольше всего не обращались;
+    устаревшие записи удаляются при обращении к ним. max_entries = 0 отключает кэш,
+    ttl_sec = 0 — срок жизни не ограничен. Попадания и промахи учитываются
+    в метрике vpe_cache_requests_total с меткой name.
+    """
+    def __init__(self, name: str, max_entries: int, ttl_sec: float = 0):
+        self.name = name
+        self.max_entries = max(0, max_entries)
+        self.ttl_sec = ttl_sec
+        self._items: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Возвращает значение по ключу или None, если записи нет или она устарела."""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] < time.monotonic():
+                del self._items[key]
+                self.expirations += 1
+                item = None
+
+            if item is None:
+                self.misses += 1
+                CACHE_REQUESTS.labels(self.name, "miss").inc()
+                return None
+
+            self._items.move_to_end(key)
+            self.hits += 1
+            CACHE_REQUESTS.labels(self.name, "hit").inc()
+            return item[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+
+        expires_at = time.monotonic() + self.ttl_sec if self.ttl_sec > 0 else float("inf")
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Удаляет все записи (например, при смене индекса)."""
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._items),
+                "max_entries": self.max_entries,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def perceptual_hash(img: Image.Image, hash_size: int = 16) -> bytes:
+    """
+    Разностный перцептивный хэш (dHash) изображения: hash_size² бит.
+
+    Изображение уменьшается до (hash_size + 1) × hash_size в оттенках серого,
+    и каждый бит показывает, ярче ли пиксель своего правого соседа. Кадры,
+    отличающиеся только шумом сжатия или незначительным масштабом, получают
+    одинаковый хэш, а размер 16 (256 бит) делает совпадение разных сцен маловероятным.
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes()
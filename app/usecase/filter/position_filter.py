@@ -1,5 +1,5 @@
 from collections import deque
-from typing import Tuple
+from typing import Optional, Tuple
 import numpy as np
 
 
@@ -23,6 +23,15 @@ class PositionFilter:
         median_lon = float(np.median(list(self.lon_buf)))
         return median_lat, median_lon
 
+    def current(self) -> Optional[Tuple[float, float]]:
+        """
+        Возвращает медианные значения текущего окна без добавления новой точки
+        или None, если буферы пусты.
+        """
+        if not self.lat_buf:
+            return None
+        return float(np.median(list(self.lat_buf))), float(np.median(list(self.lon_buf)))
+
     def clear(self) -> None:
         """Очищает буферы."""
         self.lat_buf.clear()
@@ -0,0 +1,102 @@
+import math
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Вычисляет расстояние по поверхности Земли между двумя точками в метрах.
+
+    Args:
+        lat1, lon1: Координаты первой точки в градусах.
+        lat2, lon2: Координаты второй точки в градусах.
+
+    Returns:
+        float: Расстояние в метрах.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def is_valid_coord(lat: float, lon: float) -> bool:
+    return -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+
+
+class GridSpatialIndex:
+    """
+    Пространственный индекс сцен на равномерной сетке по широте и долготе.
+
+    Каждая сцена попадает в ячейку размером cell_deg × cell_deg градусов;
+    запрос «сцены в радиусе» просматривает только ячейки, пересекающие
+    ограничивающий прямоугольник круга, и уточняет расстояние по гаверсинусу.
+    Сцены с некорректными координатами в индекс не попадают.
+    """
+    def __init__(self, cell_deg: float = 0.01):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], Set[str]] = defaultdict(set)
+        self._coords: Dict[str, Tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._coords)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def add(self, scene_id: str, lat: float, lon: float) -> bool:
+        """Добавляет сцену в индекс. Возвращает False для некорректных координат."""
+        if not is_valid_coord(lat, lon):
+            return False
+        self.remove(scene_id)
+        self._coords[scene_id] = (lat, lon)
+        self._cells[self._cell(lat, lon)].add(scene_id)
+        return True
+
+    def remove(self, scene_id: str) -> None:
+        coords = self._coords.pop(scene_id, None)
+        if coords is not None:
+            self._cells[self._cell(*coords)].discard(scene_id)
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._coords.clear()
+
+    def query(self, lat: float, lon: float, radius_m: float) -> List[Tuple[str, float]]:
+        """
+        Возвращает сцены в радиусе radius_m метров от точки, отсортированные по расстоянию.
+
+        Returns:
+            List[Tuple[str, float]]: Пары (scene_id, расстояние в метрах).
+        """
+        if not is_valid_coord(lat, lon) or radius_m < 0:
+            return []
+
+        d_lat = radius_m / METERS_PER_DEGREE_LAT
+        d_lon = d_lat / max(math.cos(math.radians(lat)), 1e-6)
+
+        lat_min, lon_min = self._cell(lat - d_lat, lon - d_lon)
+        lat_max, lon_max = self._cell(lat + d_lat, lon + d_lon)
+
+        # При большом радиусе дешевле проверить все сцены, чем перебирать пустые ячейки
+        if (lat_max - lat_min + 1) * (lon_max - lon_min + 1) > len(self._cells):
+            candidates = self._coords.keys()
+        else:
+            candidates = [
+                scene_id
+                for i in range(lat_min, lat_max + 1)
+                for j in range(lon_min, lon_max + 1)
+                for scene_id in self._cells.get((i, j), ())
+            ]
+
+        found = []
+        for scene_id in candidates:
+            dist = haversine_m(lat, lon, *self._coords[scene_id])
+            if dist <= radius_m:
+                found.append((scene_id, dist))
+
+        return sorted(found, key=lambda item: item[1])
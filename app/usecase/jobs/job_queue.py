@@ -0,0 +1,259 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED_STATUSES = {JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED}
+
+
+class QueueFullError(Exception):
+    """Очередь задач заполнена — новую задачу принять нельзя."""
+
+
+class JobCancelledError(Exception):
+    """Задача отменена клиентом во время выполнения."""
+
+
+@dataclass
+class Job:
+    job_id: str
+    status: JobStatus = JobStatus.QUEUED
+    frames_processed: int = 0
+    frames_total: Optional[int] = None
+    results: Optional[Any] = None
+    error: Optional[str] = None
+    profiled: bool = False
+    cached: bool = False
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    done_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    _callbacks: List[Callable[["Job"], None]] = field(default_factory=list, repr=False)
+    _callbacks_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add_done_callback(self, callback: Callable[["Job"], None]) -> None:
+        """
+        Регистрирует функцию, вызываемую один раз после завершения задачи в любом статусе.
+        Если задача уже завершена, функция вызывается сразу.
+        """
+        with self._callbacks_lock:
+            if not self.done_event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self) -> None:
+        with self._callbacks_lock:
+            self.done_event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"⚠️ Ошибка в обработчике завершения задачи {self.job_id}: {e}")
+
+    def check_cancelled(self) -> None:
+        """Прерывает выполнение задачи, если клиент запросил отмену."""
+        if self.cancel_event.is_set():
+            raise JobCancelledError(self.job_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status.value,
+            "frames_processed": self.frames_processed,
+            "frames_total": self.frames_total,
+            "error": self.error,
+            "profiled": self.profiled,
+            "cached": self.cached,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Очередь фоновых задач с фиксированным пулом потоков-обработчиков.
+
+    Число ожидающих задач ограничено: при переполнении submit() выбрасывает
+    QueueFullError, что позволяет серверу отвечать 429 вместо неограниченного роста
+    нагрузки. Отменённая задача в очереди сразу завершается и освобождает место.
+    Завершённые задачи хранятся ограниченное время (history_size последних).
+    """
+    def __init__(self, workers: int = 2, queue_size: int = 8, history_size: int = 100):
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._queue_size = max(1, queue_size)
+        self._pending = 0
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._history_size = history_size
+        self._worker_count = max(1, workers)
+        self._workers: List[threading.Thread] = []
+        self._workers_pid: Optional[int] = None
+
+    def start(self) -> None:
+        """
+        Запускает потоки-обработчики, если они ещё не запущены в текущем процессе.
+
+        Потоки не переживают fork, поэтому очередь, созданная в мастер-процессе
+        gunicorn --preload, запускает обработчики заново уже в воркере.
+        Вызывается при старте приложения и при каждой постановке задачи.
+        """
+        with self._lock:
+            if self._workers_pid == os.getpid():
+                return
+            if self._workers_pid is not None:
+                # В дочернем процессе условие очереди помнит ожидающие потоки
+                # родителя, которых здесь нет: уведомления ушли бы в пустоту
+                self._queue = queue.Queue()
+            self._workers_pid = os.getpid()
+            self._workers = [
+                threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                for i in range(self._worker_count)
+            ]
+        for worker in self._workers:
+            worker.start()
+
+    # --- Внутренние методы ---
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            job, task = item
+            with self._lock:
+                # Задача, отменённая в очереди, уже завершена методом cancel()
+                if job.status == JobStatus.CANCELLED:
+                    continue
+                job.status = JobStatus.RUNNING
+                self._pending -= 1
+
+            try:
+                self._run(job, task)
+            finally:
+                job._finish()
+
+    def _run(self, job: Job, task: Callable[[Job], Any]):
+        job.started_at = time.time()
+        try:
+            job.results = task(job)
+            job.status = JobStatus.DONE
+        except JobCancelledError:
+            job.status = JobStatus.CANCELLED
+        except Exception as e:
+            print(f"❌ Ошибка в задаче {job.job_id}: {e}")
+            job.error = str(e)
+            job.status = JobStatus.FAILED
+        finally:
+            job.finished_at = time.time()
+            self._evict_finished()
+
+    def _evict_finished(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATUSES]
+            for job_id in finished[:max(0, len(finished) - self._history_size)]:
+                del self._jobs[job_id]
+
+    # --- Публичный API ---
+
+    @property
+    def depth(self) -> int:
+        """Количество задач, ожидающих обработчика (без отменённых)."""
+        with self._lock:
+            return self._pending
+
+    def is_full(self) -> bool:
+        with self._lock:
+            return self._pending >= self._queue_size
+
+    def submit(self, task: Callable[[Job], Any],
+               on_finish: Optional[Callable[[Job], None]] = None) -> Job:
+        """
+        Ставит задачу в очередь.
+
+        :param task: функция, выполняющая работу; получает объект Job для отчёта
+                     о прогрессе и проверки отмены, возвращает результаты
+        :param on_finish: вызывается после завершения задачи в любом статусе
+                          (например, для удаления временных файлов)
+        :raises QueueFullError: если очередь заполнена
+        """
+        self.start()
+        job = Job(job_id=str(uuid.uuid4()))
+        if on_finish is not None:
+            job.add_done_callback(on_finish)
+
+        with self._lock:
+            if self._pending >= self._queue_size:
+                raise QueueFullError("Очередь задач заполнена")
+            self._pending += 1
+            self._jobs[job.job_id] = job
+        self._queue.put((job, task))
+        return job
+
+    def add_completed(self, results: Any) -> Job:
+        """
+        Регистрирует уже выполненную задачу без постановки в очередь
+        (например, когда результаты взяты из кэша). Задача доступна по
+        идентификатору так же, как обработанные обычным путём.
+        """
+        now = time.time()
+        job = Job(job_id=str(uuid.uuid4()), status=JobStatus.DONE, results=results,
+                  cached=True, started_at=now, finished_at=now)
+        job._finish()
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Отменяет задачу. Задача в очереди сразу получает статус cancelled и освобождает
+        место в очереди, выполняющаяся — прерывается при следующей проверке check_cancelled().
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+
+        with self._lock:
+            cancelled_in_queue = job.status == JobStatus.QUEUED
+            if cancelled_in_queue:
+                job.status = JobStatus.CANCELLED
+                job.finished_at = time.time()
+                self._pending -= 1
+            elif job.status not in FINISHED_STATUSES:
+                job.cancel_event.set()
+
+        if cancelled_in_queue:
+            job.cancel_event.set()
+            job._finish()
+            self._evict_finished()
+        return job
+
+    def shutdown(self):
+        """Останавливает обработчики после завершения уже принятых задач."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
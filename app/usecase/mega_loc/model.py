@@ -18,9 +18,10 @@ class MegaLoc(nn.Module):
         cluster_dim=256,
         token_dim=256,
         mlp_dim=512,
+        hub_dir=None,
     ):
         super().__init__()
-        self.backbone = DINOv2()
+        self.backbone = DINOv2(hub_dir)
         self.salad_out_dim = num_clusters * cluster_dim + token_dim
         self.aggregator = Aggregator(
             feat_dim=feat_dim,
@@ -70,9 +71,13 @@ class Aggregator(nn.Module):
 
 
 class DINOv2(nn.Module):
-    def __init__(self):
+    def __init__(self, hub_dir=None):
         super().__init__()
-        self.model = torch.hub.load("facebookresearch/dinov2", "dinov2_vitb14", pretrained=False)
+        if hub_dir:
+            # Local checkout of facebookresearch/dinov2, allows loading without network access
+            self.model = torch.hub.load(hub_dir, "dinov2_vitb14", source="local", pretrained=False)
+        else:
+            self.model = torch.hub.load("facebookresearch/dinov2", "dinov2_vitb14", pretrained=False)
         self.num_channels = 768
 
     def forward(self, images):
@@ -0,0 +1,64 @@
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# --- Реестр метрик сервиса ---
+REGISTRY = CollectorRegistry()
+
+# Границы гистограмм (секунды): от быстрых обращений к Redis до инференса на CPU
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_LATENCY = Histogram(
+    "vpe_stage_duration_seconds",
+    "Время выполнения этапов обработки",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+
+HTTP_LATENCY = Histogram(
+    "vpe_http_request_duration_seconds",
+    "Время обработки HTTP-запросов",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+
+FRAMES = Counter(
+    "vpe_frames_total",
+    "Кадры видео по результату обработки: sampled, matched, verified",
+    ["result"],
+    registry=REGISTRY,
+)
+
+SESSION_FRAMES = Counter(
+    "vpe_session_frames_total",
+    "Кадры сессий локализации: processed, dropped",
+    ["result"],
+    registry=REGISTRY,
+)
+
+CACHE_REQUESTS = Counter(
+    "vpe_cache_requests_total",
+    "Обращения к кэшам по результату: hit, miss",
+    ["cache", "result"],
+    registry=REGISTRY,
+)
+
+JOB_QUEUE_DEPTH = Gauge(
+    "vpe_job_queue_depth",
+    "Количество задач, ожидающих обработчика",
+    registry=REGISTRY,
+)
+
+
+def timed(stage: str):
+    """
+    Контекстный менеджер, записывающий длительность блока в гистограмму этапа.
+
+    Этапы: decode, inference, faiss_search, storage, scene_load, geometry.
+    """
+    return STAGE_LATENCY.labels(stage).time()
+
+
+def render_metrics() -> bytes:
+    """Возвращает все метрики в текстовом формате Prometheus."""
+    return generate_latest(REGISTRY)
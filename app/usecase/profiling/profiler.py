@@ -0,0 +1,135 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import torch
+
+# Артефакты, сохраняемые для каждого профилируемого запроса
+PYTHON_STATS = "python.prof"
+PYTHON_REPORT = "python.txt"
+TORCH_REPORT = "torch_ops.txt"
+TORCH_TRACE = "torch_trace.json"
+ARTIFACTS = (PYTHON_STATS, PYTHON_REPORT, TORCH_REPORT, TORCH_TRACE)
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# Область охвата профилей: cProfile — только поток запроса, torch — весь процесс
+PROFILE_SCOPE = {"python": "thread", "torch": "process"}
+
+# torch.profiler — один на процесс: два пересекающихся профиля роняют процесс (kineto),
+# поэтому одновременно снимается не больше одного профиля на процесс
+_PROFILE_LOCK = threading.Lock()
+
+TORCH_SCOPE_NOTE = (
+    "# Профиль torch охватывает операторы всех потоков процесса за время запроса,\n"
+    "# включая параллельные задачи (JOB_WORKERS > 1), /ws/localize и /recognize-images.\n"
+    "# Для чистого профиля одного запроса снимайте его при JOB_WORKERS=1 без другой нагрузки.\n\n"
+)
+
+
+class ProfilerBusyError(RuntimeError):
+    """В процессе уже снимается профиль другого запроса."""
+
+
+class RequestProfiler:
+    """
+    Профилирование отдельных запросов по требованию.
+
+    Собирает Python-профиль (cProfile) и профиль операторов torch для кода,
+    выполняемого внутри profile(), и сохраняет артефакты в output_dir/<request_id>/.
+    cProfile учитывает только текущий поток, поэтому профиль нужно снимать
+    в том потоке, где выполняется обработка запроса.
+
+    Профилировщик torch, напротив, записывает операторы всех потоков процесса:
+    если одновременно выполняются другие запросы, их инференс попадает
+    в torch_ops.txt и torch_trace.json. Об этом предупреждает заголовок torch_ops.txt.
+
+    Профили не пересекаются: перед profile() профилировщик занимается reserve(),
+    который отказывает, пока снимается другой профиль, и освобождается release().
+    """
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+
+    def _request_dir(self, request_id: str) -> Optional[str]:
+        if not REQUEST_ID_PATTERN.match(request_id):
+            return None
+        return os.path.join(self.output_dir, request_id)
+
+    @staticmethod
+    def reserve() -> None:
+        """
+        Занимает профилировщик процесса под один запрос.
+
+        :raises ProfilerBusyError: если профилировщик уже занят
+        """
+        if not _PROFILE_LOCK.acquire(blocking=False):
+            raise ProfilerBusyError("Профилировщик занят другим запросом, повторите позже")
+
+    @staticmethod
+    def release() -> None:
+        _PROFILE_LOCK.release()
+
+    @contextmanager
+    def profile(self, request_id: str) -> Iterator[None]:
+        """Снимает профиль кода внутри блока; профилировщик должен быть занят reserve()."""
+        request_dir = self._request_dir(request_id)
+        if request_dir is None:
+            raise ValueError(f"Некорректный идентификатор запроса: {request_id}")
+        if not _PROFILE_LOCK.locked():
+            raise RuntimeError("Профилирование без reserve(): профили могли бы пересечься")
+
+        py_profiler = cProfile.Profile()
+        with torch.profiler.profile(
+            activities=[torch.profiler.ProfilerActivity.CPU],
+            record_shapes=True,
+        ) as torch_profiler:
+            py_profiler.enable()
+            try:
+                yield
+            finally:
+                py_profiler.disable()
+
+        os.makedirs(request_dir, exist_ok=True)
+        self._save_python(py_profiler, request_dir)
+        self._save_torch(torch_profiler, request_dir)
+        print(f"📊 Профиль запроса {request_id} сохранён: {request_dir}")
+
+    @staticmethod
+    def _save_python(py_profiler: cProfile.Profile, request_dir: str) -> None:
+        py_profiler.dump_stats(os.path.join(request_dir, PYTHON_STATS))
+
+        report = io.StringIO()
+        stats = pstats.Stats(py_profiler, stream=report)
+        stats.sort_stats("cumulative").print_stats(60)
+        with open(os.path.join(request_dir, PYTHON_REPORT), "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+
+    @staticmethod
+    def _save_torch(torch_profiler, request_dir: str) -> None:
+        table = torch_profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=50)
+        with open(os.path.join(request_dir, TORCH_REPORT), "w", encoding="utf-8") as f:
+            f.write(TORCH_SCOPE_NOTE)
+            f.write(table)
+        torch_profiler.export_chrome_trace(os.path.join(request_dir, TORCH_TRACE))
+
+    def list_artifacts(self, request_id: str) -> List[str]:
+        """Возвращает имена сохранённых артефактов запроса."""
+        request_dir = self._request_dir(request_id)
+        if request_dir is None or not os.path.isdir(request_dir):
+            return []
+        return [name for name in ARTIFACTS if os.path.exists(os.path.join(request_dir, name))]
+
+    def artifact_path(self, request_id: str, name: str) -> Optional[str]:
+        """Возвращает путь к артефакту или None, если он не существует."""
+        if name not in ARTIFACTS:
+            return None
+        request_dir = self._request_dir(request_id)
+        if request_dir is None:
+            return None
+        path = os.path.join(request_dir, name)
+        return path if os.path.exists(path) else None
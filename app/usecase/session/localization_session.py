@@ -0,0 +1,72 @@
+import time
+import uuid
+from typing import Any, Dict
+
+from PIL import Image
+
+from app.usecase.vpr.vpr import VPRSystem
+from app.usecase.filter.position_filter import PositionFilter
+
+
+class LocalizationSession:
+    """
+    Сессия локализации в реальном времени для одного клиента.
+
+    Хранит собственный PositionFilter, поэтому позиция сглаживается по кадрам
+    именно этого клиента, и счётчики принятых, обработанных и пропущенных кадров.
+    """
+    def __init__(self, vpr_system: VPRSystem, window: int = 5, max_dist: float = 1.5):
+        self.session_id = str(uuid.uuid4())
+        self.vpr = vpr_system
+        self.max_dist = max_dist
+        self.filter = PositionFilter(window)
+
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    def localize(self, img: Image.Image, frame_seq: int) -> Dict[str, Any]:
+        """
+        Ищет место для кадра и обновляет сглаженную позицию.
+
+        Если место не распознано, фильтр не обновляется, а в ответе возвращается
+        последняя сглаженная позиция (или None, если её ещё нет).
+        """
+        started = time.perf_counter()
+        res = self.vpr.search(img, max_dist=self.max_dist)
+        inference_ms = (time.perf_counter() - started) * 1000
+        self.frames_processed += 1
+
+        result: Dict[str, Any] = {
+            "seq": frame_seq,
+            "matched": res is not None,
+            "inference_ms": round(inference_ms, 2),
+        }
+
+        if res is not None:
+            md = res.metadata
+            smoothed = self.filter.update(md.latitude, md.longitude)
+            result.update({
+                "scene_id": md.scene_id,
+                "title": md.title,
+                "raw_latitude": md.latitude,
+                "raw_longitude": md.longitude,
+                "distance": res.distance,
+            })
+        else:
+            smoothed = self.filter.current()
+
+        result["latitude"], result["longitude"] = smoothed if smoothed else (None, None)
+        return result
+
+    def reset(self) -> None:
+        """Сбрасывает накопленную историю позиций."""
+        self.filter.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "frames_received": self.frames_received,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+        }
@@ -4,6 +4,7 @@ import numpy as np
 
 from typing import Optional
 from ...domain.model import SceneMetadata
+from ..metrics.metrics import timed
 
 
 # --- Константы шаблонов ключей ---
@@ -15,14 +16,13 @@ class RedisStub:
     """Заглушка Redis, если сервер недоступен. Работает полностью в памяти."""
     def __init__(self):
         self._data = {}
-        self._counters = {}
 
     def ping(self):
         return True
 
     def incr(self, key):
-        self._counters[key] = self._counters.get(key, 0) + 1
-        return self._counters[key]
+        self._data[key] = int(self._data.get(key, 0)) + 1
+        return self._data[key]
 
     def set(self, key, value):
         self._data[key] = value
@@ -30,12 +30,14 @@ class RedisStub:
     def get(self, key):
         return self._data.get(key)
 
+    def mget(self, keys):
+        return [self._data.get(key) for key in keys]
+
     def exists(self, key):
         return key in self._data
 
     def flushdb(self):
         self._data.clear()
-        self._counters.clear()
 
 
 class Storage:
@@ -45,6 +47,11 @@ class Storage:
     """
     def __init__(self, host: str, port: int):
         self._client = self._connect(host, port)
+        # Дескрипторы хранятся байтами, поэтому читаются клиентом без декодирования в str
+        self._binary_client = (
+            redis.Redis(host=host, port=port, decode_responses=False)
+            if isinstance(self._client, redis.Redis) else self._client
+        )
 
     def _connect(self, host: str, port: int):
         try:
@@ -59,15 +66,18 @@ class Storage:
     # --- Внутренние методы ---
 
     def _set(self, key, value):
-        self._client.set(key, value)
+        with timed("storage"):
+            self._client.set(key, value)
 
     def _get(self, key):
-        return self._client.get(key)
+        with timed("storage"):
+            return self._client.get(key)
 
     def _exists(self, key):
-        if isinstance(self._client, redis.Redis):
-            return self._client.exists(key) > 0
-        return self._client.exists(key)
+        with timed("storage"):
+            if isinstance(self._client, redis.Redis):
+                return self._client.exists(key) > 0
+            return self._client.exists(key)
 
     # --- Публичный API ---
 
@@ -75,7 +85,8 @@ class Storage:
         self._client.flushdb()
 
     def next_id(self, key: str) -> int:
-        return self._client.incr(key)
+        with timed("storage"):
+            return self._client.incr(key)
 
     def scene_exists(self, scene_id: str) -> bool:
         return self._exists(SCENE_KEY_TEMPLATE.format(scene_id))
@@ -83,6 +94,22 @@ class Storage:
     def set_descriptor(self, scene_id: str, desc_id: str, desc: np.ndarray):
         self._set(SCENE_DESCRIPTOR_KEY(scene_id, desc_id), desc.tobytes())
 
+    def get_descriptors(self, scene_id: str) -> Optional[np.ndarray]:
+        """
+        Возвращает все сохранённые дескрипторы сцены матрицей (n, d)
+        или None, если для сцены нет дескрипторов.
+        """
+        count = int(self._get(f"{scene_id}:counter") or 0)
+        if count == 0:
+            return None
+
+        keys = [SCENE_DESCRIPTOR_KEY(scene_id, desc_id) for desc_id in range(1, count + 1)]
+        with timed("storage"):
+            raw = self._binary_client.mget(keys)
+
+        descs = [np.frombuffer(item, dtype="float32") for item in raw if item is not None]
+        return np.stack(descs) if descs else None
+
     def set_scene_metadata(self, scene_id: str, metadata: SceneMetadata) -> None:
         key = SCENE_KEY_TEMPLATE.format(scene_id)
         self._set(key, json.dumps(metadata.__dict__))
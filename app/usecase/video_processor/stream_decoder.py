@@ -0,0 +1,144 @@
+import struct
+import subprocess
+import threading
+from collections import deque
+from io import BytesIO
+from typing import Iterator, Optional, Tuple
+
+from PIL import Image
+
+from app.config.config import CONFIG
+from app.usecase.metrics.metrics import timed
+
+# Заголовок BMP: сигнатура 'BM' и полный размер файла (uint32, little-endian)
+BMP_HEADER_SIZE = 14
+
+# Сколько последних строк stderr ffmpeg хранить для сообщения об ошибке
+STDERR_TAIL_LINES = 20
+
+
+class StreamVideoDecoder:
+    def __init__(self, step: int = 10, ffmpeg_path: Optional[str] = None):
+        """
+        Потоковый декодер видео на основе ffmpeg.
+
+        В отличие от VideoProcessor, не требует готового файла: байты видео подаются
+        в stdin ffmpeg по мере поступления (feed), а выбранные кадры читаются из stdout
+        (frames) параллельно с загрузкой.
+
+        Декодировать «на лету» можно только потоковые контейнеры (fragmented/faststart MP4,
+        MKV, WebM, MPEG-TS). Для MOV/MP4 с moov-атомом в конце файла ffmpeg не сможет
+        начать декодирование без произвольного доступа.
+
+        :param step: шаг пропуска кадров (берётся каждый step-й кадр)
+        :param ffmpeg_path: путь к исполняемому файлу ffmpeg
+        """
+        self.step = max(1, step)
+        self.ffmpeg_path = ffmpeg_path or CONFIG['stream']['ffmpeg_path']
+        self._proc: Optional[subprocess.Popen] = None
+        self._stderr_tail: deque = deque(maxlen=STDERR_TAIL_LINES)
+        self._stderr_reader: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Запускает процесс ffmpeg. Прореживание кадров выполняется фильтром select
+        внутри ffmpeg, поэтому пропущенные кадры не конвертируются и не передаются
+        через pipe. Кадры отдаются в формате BMP, размер которого указан в заголовке.
+        """
+        cmd = [
+            self.ffmpeg_path,
+            '-hide_banner', '-loglevel', 'error',
+            '-i', 'pipe:0',
+            '-vf', f'select=not(mod(n\\,{self.step}))',
+            '-vsync', 'vfr',
+            '-f', 'image2pipe', '-c:v', 'bmp',
+            'pipe:1',
+        ]
+        self._proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # stderr вычитывается постоянно: иначе при потоке ошибок на битом входе
+        # ffmpeg заполнит pipe, заблокируется и перестанет отдавать кадры и читать stdin
+        self._stderr_reader = threading.Thread(target=self._drain_stderr, name="ffmpeg-stderr", daemon=True)
+        self._stderr_reader.start()
+
+    def _drain_stderr(self) -> None:
+        for line in iter(self._proc.stderr.readline, b''):
+            self._stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+        self._proc.stderr.close()
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Передаёт очередную порцию байтов видео в ffmpeg.
+
+        :return: False, если ffmpeg уже завершился и дальнейшая передача бессмысленна
+        """
+        try:
+            self._proc.stdin.write(chunk)
+            return True
+        except (BrokenPipeError, ValueError):
+            return False
+
+    def close_input(self) -> None:
+        """Сообщает ffmpeg о конце входного потока."""
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def _read_exact(self, size: int) -> Optional[bytes]:
+        data = self._proc.stdout.read(size)
+        if len(data) < size:
+            return None
+        return data
+
+    def frames(self) -> Iterator[Tuple[Image.Image, int]]:
+        """
+        Генератор кадров, декодированных ffmpeg, по мере их готовности.
+
+        Блокирует до появления очередного кадра, поэтому должен выполняться
+        в отдельном потоке параллельно с feed().
+
+        :return: генератор пар (PIL.Image, номер кадра в исходном видео)
+        """
+        count = 0
+        try:
+            while True:
+                header = self._read_exact(BMP_HEADER_SIZE)
+                if header is None:
+                    break
+
+                size = struct.unpack('<I', header[2:6])[0]
+                body = self._read_exact(size - BMP_HEADER_SIZE)
+                if body is None:
+                    break
+
+                with timed('decode'):
+                    img = Image.open(BytesIO(header + body)).convert('RGB')
+                yield img, count * self.step
+                count += 1
+
+            if self._proc.wait() != 0 and count == 0:
+                self._stderr_reader.join(timeout=1)
+                errors = "\n".join(self._stderr_tail).strip()
+                raise IOError(f"Не удалось декодировать видеопоток: {errors or 'неизвестная ошибка ffmpeg'}")
+        finally:
+            self._proc.stdout.close()
+
+    def close(self) -> None:
+        """
+        Завершает процесс ffmpeg, если он ещё работает. Читающий поток frames()
+        после этого получает конец потока и закрывает свои pipe сам.
+        """
+        if self._proc is None:
+            return
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.wait()
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
@@ -1,6 +1,8 @@
 import cv2
 from PIL import Image
-from typing import Iterator
+from typing import Iterator, Optional
+
+from app.usecase.metrics.metrics import timed
 
 
 class VideoProcessor:
@@ -15,6 +17,21 @@ class VideoProcessor:
         self.video_path = video_path
         self.step = max(1, step)  # Гарантируем, что шаг не меньше 1
 
+    def sampled_frame_count(self) -> Optional[int]:
+        """
+        Оценивает число кадров, которые вернёт frames(), по метаданным контейнера.
+
+        :return: количество выбранных кадров или None, если контейнер его не сообщает
+        """
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        finally:
+            cap.release()
+        if total <= 0:
+            return None
+        return (total + self.step - 1) // self.step
+
     def frames(self) -> Iterator[Image.Image]:
         """
         Генератор кадров из видео с заданным шагом.
@@ -36,13 +53,19 @@ class VideoProcessor:
         frame_id = 0
         try:
             while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
+                with timed("decode"):
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+
+                    if frame_id % self.step == 0:
+                        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                        img = Image.fromarray(rgb_frame)
+                    else:
+                        img = None
 
-                if frame_id % self.step == 0:
-                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    yield Image.fromarray(rgb_frame), frame_id
+                if img is not None:
+                    yield img, frame_id
 
                 frame_id += 1
         finally:
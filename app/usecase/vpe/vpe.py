@@ -1,34 +1,61 @@
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Optional
+from PIL import Image
+from app.domain.model import PlaceRecognizeResult
+from app.usecase.jobs.job_queue import Job
 from app.usecase.video_processor.video_processor import VideoProcessor
 from app.usecase.vpr.vpr import VPRSystem
 from app.usecase.loader.scene_loader import load_scene_images_by_id
 from app.usecase.filter.geometry import is_valid_match
+from app.usecase.metrics.metrics import timed, FRAMES
 
 
 class VPEProcessor:
-    def __init__(self, vpr_system: VPRSystem, frame_step: int = 30):
+    def __init__(self, vpr_system: VPRSystem, frame_step: int = 30, scenes_dir: str = "data/scenes/"):
         self.vpr = vpr_system
         self.frame_step = frame_step
+        self.scenes_dir = scenes_dir
 
-    def process_video(self, video_path: str) -> List[Dict[str, Any]]:
+    def process_video(self, video_path: str, job: Optional[Job] = None) -> List[Dict[str, Any]]:
         video_processor = VideoProcessor(video_path, self.frame_step)
+        frames = video_processor.frames()
+
+        if job is not None:
+            job.frames_total = video_processor.sampled_frame_count()
+
+        return list(self.process_frames(frames, job))
+
+    @staticmethod
+    def _track_job(frames: Iterable[Tuple[Image.Image, int]], job: Job) -> Iterator[Tuple[Image.Image, int]]:
+        """Обновляет прогресс задачи и прерывает обработку при её отмене."""
+        for item in frames:
+            job.check_cancelled()
+            yield item
+            job.frames_processed += 1
+
+    def process_frames(self, frames: Iterable[Tuple[Image.Image, int]],
+                       job: Optional[Job] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Распознаёт места по последовательности кадров и отдаёт каждое новое
+        подтверждённое место сразу после проверки, не дожидаясь конца видео.
+        Если передана задача, обновляется её прогресс и проверяется отмена.
+        """
+        if job is not None:
+            frames = self._track_job(frames, job)
+
         seen_coords = set()
-        results: List[Dict[str, Any]] = []
 
-        for img, frame_idx in video_processor.frames():
+        for img, frame_idx in frames:
+            FRAMES.labels("sampled").inc()
             res = self.vpr.search(img)
             if not res:
                 continue
 
-            try:
-                scene_images = load_scene_images_by_id(res.metadata.scene_id)
-            except FileNotFoundError as e:
-                print(f"⚠️ {e}")
+            FRAMES.labels("matched").inc()
+            if not self.verify(img, res.metadata.scene_id):
                 continue
 
-            # Применяем гомографию к каждому изображению сцены
-            if not any(is_valid_match(img, ref_img) for ref_img in scene_images):
-                continue
+            FRAMES.labels("verified").inc()
 
             md = res.metadata
             coord_key = (round(md.latitude, 6), round(md.longitude, 6))
@@ -38,13 +65,53 @@ class VPEProcessor:
 
             seen_coords.add(coord_key)
 
-            results.append({
-                "scene_id": md.scene_id,
-                "title": md.title,
-                "description": md.description,
-                "latitude": md.latitude,
-                "longitude": md.longitude,
-                "distance": res.distance,
-            })
+            yield {**self._place_to_dict(res), "frame": frame_idx}
+
+    def recognize_images(self, images: List[Image.Image], verify: bool = False, workers: int = 4,
+                         location: Optional[Tuple[float, float]] = None,
+                         radius_m: Optional[float] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Распознаёт места для набора независимых изображений.
+
+        Дескрипторы вычисляются батчами и ищутся одним запросом к индексу.
+        При verify=True найденные места дополнительно проверяются гомографией
+        параллельно в пуле потоков; непрошедшие проверку результаты заменяются на None.
+        Позиция location и радиус radius_m ограничивают поиск сценами поблизости.
+        """
+        found = self.vpr.search_batch(images, location=location, radius_m=radius_m)
+        if not verify:
+            return [self._place_to_dict(res) if res else None for res in found]
+
+        def check(pair: Tuple[Image.Image, Optional[PlaceRecognizeResult]]) -> Optional[Dict[str, Any]]:
+            img, res = pair
+            if res is None or not self.verify(img, res.metadata.scene_id):
+                return None
+            return self._place_to_dict(res)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return list(pool.map(check, zip(images, found)))
+
+    def verify(self, img: Image.Image, scene_id: str) -> bool:
+        """Проверяет совпадение кадра со сценой гомографией по её изображениям."""
+        try:
+            with timed("scene_load"):
+                scene_images = load_scene_images_by_id(scene_id, self.scenes_dir)
+        except FileNotFoundError as e:
+            print(f"⚠️ {e}")
+            return False
+
+        # Применяем гомографию к каждому изображению сцены
+        with timed("geometry"):
+            return any(is_valid_match(img, ref_img) for ref_img in scene_images)
 
-        return results
+    @staticmethod
+    def _place_to_dict(res: PlaceRecognizeResult) -> Dict[str, Any]:
+        md = res.metadata
+        return {
+            "scene_id": md.scene_id,
+            "title": md.title,
+            "description": md.description,
+            "latitude": md.latitude,
+            "longitude": md.longitude,
+            "distance": res.distance,
+        }
@@ -0,0 +1,141 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+from ...domain.model import SceneMetadata
+
+# --- Файлы артефакта индекса ---
+MANIFEST_FILE = "manifest.json"
+DESCRIPTORS_FILE = "descriptors.npy"
+DESCRIPTOR_SCENES_FILE = "descriptor_scenes.json"
+SCENES_FILE = "scenes.json"
+ARTIFACT_VERSION = 1
+
+
+@dataclass
+class IndexArtifact:
+    manifest: Dict[str, Any]
+    descriptors: np.ndarray
+    descriptor_to_scene: List[str]
+    scenes: List[SceneMetadata]
+
+
+def artifact_exists(path: str) -> bool:
+    """Артефакт считается готовым, только если записан манифест — он пишется последним."""
+    return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+
+def entries_digest(entries: List[Dict[str, Any]]) -> str:
+    """
+    Отпечаток набора записей сцен, по которому построен артефакт: пути, метаданные
+    и размер/время изменения файлов. Не зависит от порядка записей; совпадение
+    отпечатков означает, что артефакт построен по тем же данным.
+    """
+    lines = []
+    for entry in entries:
+        try:
+            stat = os.stat(entry["path"])
+            size, mtime = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size, mtime = -1, -1
+        lines.append(json.dumps([entry, size, mtime], sort_keys=True, ensure_ascii=False, default=str))
+
+    digest = hashlib.sha1()
+    for line in sorted(lines):
+        digest.update(line.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    """Читает манифест артефакта без загрузки дескрипторов."""
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_index_artifact(path: str, descriptors: np.ndarray, descriptor_to_scene: List[str],
+                        scenes: List[SceneMetadata], extra: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Сохраняет индекс в каталог path: матрицу дескрипторов (.npy), отображение
+    дескриптор -> сцена, метаданные сцен и манифест.
+
+    Запись атомарна: файлы пишутся во временный каталог, который затем
+    переименовывается в path, поэтому читатели никогда не видят частичный артефакт.
+
+    Returns:
+        Dict[str, Any]: Манифест сохранённого артефакта.
+    """
+    descriptors = np.ascontiguousarray(descriptors, dtype="float32")
+    if len(descriptors) != len(descriptor_to_scene):
+        raise ValueError("Число дескрипторов не совпадает с отображением на сцены")
+
+    tmp_path = f"{path.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, DESCRIPTORS_FILE), descriptors)
+    with open(os.path.join(tmp_path, DESCRIPTOR_SCENES_FILE), "w", encoding="utf-8") as f:
+        json.dump(descriptor_to_scene, f, ensure_ascii=False)
+    with open(os.path.join(tmp_path, SCENES_FILE), "w", encoding="utf-8") as f:
+        json.dump([scene.__dict__ for scene in scenes], f, ensure_ascii=False)
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "count": int(descriptors.shape[0]),
+        "dim": int(descriptors.shape[1]) if descriptors.ndim == 2 else 0,
+        "scenes": len(scenes),
+        **(extra or {}),
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+    print(f"💾 Артефакт индекса сохранён: {path} ({manifest['count']} дескрипторов)")
+    return manifest
+
+
+def load_index_artifact(path: str) -> IndexArtifact:
+    """
+    Загружает артефакт индекса. Матрица дескрипторов отображается в память
+    только для чтения, поэтому процессы, загрузившие один и тот же артефакт,
+    разделяют её страницы через page cache, а не держат собственные копии.
+    """
+    if not artifact_exists(path):
+        raise FileNotFoundError(f"Артефакт индекса не найден: {path}")
+
+    manifest = read_manifest(path)
+    if manifest.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия артефакта: {manifest.get('version')}")
+
+    descriptors = np.load(os.path.join(path, DESCRIPTORS_FILE), mmap_mode="r")
+    with open(os.path.join(path, DESCRIPTOR_SCENES_FILE), encoding="utf-8") as f:
+        descriptor_to_scene = json.load(f)
+    with open(os.path.join(path, SCENES_FILE), encoding="utf-8") as f:
+        scenes = [SceneMetadata(**scene) for scene in json.load(f)]
+
+    return IndexArtifact(manifest, descriptors, descriptor_to_scene, scenes)
+
+
+@contextmanager
+def artifact_lock(path: str) -> Iterator[None]:
+    """
+    Межпроцессная блокировка построения артефакта: первый процесс строит индекс,
+    остальные ждут на блокировке и затем подключаются к готовому артефакту.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path.rstrip(os.sep)}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
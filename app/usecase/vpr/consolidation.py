@@ -0,0 +1,29 @@
+import faiss
+import numpy as np
+
+
+def select_representatives(descs: np.ndarray, max_count: int, seed: int = 0) -> np.ndarray:
+    """
+    Выбирает не более max_count представительных дескрипторов сцены.
+
+    Дескрипторы кластеризуются k-means на max_count кластеров, и от каждого
+    кластера остаётся медоид — ближайший к центроиду реальный дескриптор.
+    Медоиды, в отличие от центроидов, сохраняют нормировку дескрипторов MegaLoc,
+    поэтому порог расстояния поиска для них остаётся прежним.
+
+    :param descs: дескрипторы изображений сцены, матрица (n, d)
+    :param max_count: максимальное число представителей (0 — без ограничения)
+    :return: отсортированные индексы строк descs, оставляемых в индексе
+    """
+    n = len(descs)
+    if max_count <= 0 or n <= max_count:
+        return np.arange(n)
+
+    descs = np.ascontiguousarray(descs, dtype="float32")
+    kmeans = faiss.Kmeans(descs.shape[1], max_count, niter=20, seed=seed,
+                          min_points_per_centroid=1, max_points_per_centroid=max(256, n))
+    kmeans.train(descs)
+
+    # Для каждого центроида — ближайший дескриптор; совпадающие медоиды схлопываются
+    _, medoids = faiss.knn(kmeans.centroids, descs, 1)
+    return np.unique(medoids[:, 0])
@@ -0,0 +1,102 @@
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+
+class FlatIndex:
+    """
+    Точный L2-индекс дескрипторов на основе faiss.IndexFlatL2.
+
+    Поддерживает поиск по подмножеству дескрипторов (candidate_ids) через
+    ID-селектор FAISS: расстояния считаются только для выбранных векторов.
+    """
+    def __init__(self, dim: int):
+        self._index = faiss.IndexFlatL2(dim)
+
+    @property
+    def d(self) -> int:
+        return self._index.d
+
+    @property
+    def ntotal(self) -> int:
+        return self._index.ntotal
+
+    def descriptors(self) -> np.ndarray:
+        return self._index.reconstruct_n(0, self._index.ntotal)
+
+    def add(self, descs: np.ndarray, scene_ids: Optional[List[str]] = None) -> None:
+        self._index.add(descs)
+
+    def reset(self) -> None:
+        self._index.reset()
+
+    def close(self) -> None:
+        pass
+
+    def search(self, queries: np.ndarray, k: int,
+               candidate_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ищет k ближайших дескрипторов для каждого запроса.
+
+        :param candidate_ids: если задан, поиск ограничивается этими идентификаторами
+        :return: матрицы расстояний и идентификаторов размера (len(queries), k)
+        """
+        if candidate_ids is None:
+            return self._index.search(queries, k)
+
+        ids = np.ascontiguousarray(candidate_ids, dtype="int64")
+        selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+        return self._index.search(queries, k, params=faiss.SearchParameters(sel=selector))
+
+
+class MmapFlatIndex:
+    """
+    Точный L2-индекс только для чтения поверх матрицы дескрипторов, отображённой в память.
+
+    В отличие от FlatIndex, не копирует дескрипторы в собственный буфер FAISS:
+    поиск выполняется faiss.knn прямо по np.memmap, поэтому несколько процессов,
+    открывших один файл, используют общие страницы page cache.
+    """
+    def __init__(self, descriptors: np.ndarray):
+        self._descriptors = descriptors
+
+    @property
+    def d(self) -> int:
+        return self._descriptors.shape[1]
+
+    @property
+    def ntotal(self) -> int:
+        return self._descriptors.shape[0]
+
+    def descriptors(self) -> np.ndarray:
+        return self._descriptors
+
+    def add(self, descs: np.ndarray, scene_ids: Optional[List[str]] = None) -> None:
+        raise RuntimeError("Индекс, загруженный из артефакта, доступен только для чтения")
+
+    def reset(self) -> None:
+        raise RuntimeError("Индекс, загруженный из артефакта, доступен только для чтения")
+
+    def close(self) -> None:
+        pass
+
+    def search(self, queries: np.ndarray, k: int,
+               candidate_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if candidate_ids is None:
+            return _pad(*faiss.knn(queries, self._descriptors, min(k, self.ntotal)), k)
+
+        ids = np.asarray(candidate_ids, dtype="int64")
+        subset = np.ascontiguousarray(self._descriptors[ids])
+        distances, local_ids = faiss.knn(queries, subset, min(k, len(ids)))
+        return _pad(distances, np.where(local_ids >= 0, ids[local_ids], -1), k)
+
+
+def _pad(distances: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Дополняет выдачу до k столбцов так же, как FAISS: расстоянием inf и id -1."""
+    missing = k - ids.shape[1]
+    if missing <= 0:
+        return distances, ids
+    n = ids.shape[0]
+    return (np.hstack([distances, np.full((n, missing), np.inf, dtype="float32")]),
+            np.hstack([ids, np.full((n, missing), -1, dtype="int64")]))
@@ -0,0 +1,234 @@
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.domain.model import SceneMetadata
+from app.usecase.vpr.artifact import artifact_lock, entries_digest, save_index_artifact
+from app.usecase.vpr.consolidation import select_representatives
+
+PLAN_FILE = "plan.json"
+MERGED_FILE = "merged.npy"
+CHUNK_FILE_TEMPLATE = "chunk-{:05d}.npz"
+
+# VPRSystem процесса-обработчика: модель загружается один раз на процесс
+_worker_vpr = None
+_worker_error: Optional[str] = None
+
+
+def _init_worker(threads: int) -> None:
+    global _worker_vpr, _worker_error
+    try:
+        import torch
+        from app.utils.env_patch import apply_openmp_patch
+        from app.usecase.vpr.vpr import VPRSystem
+
+        apply_openmp_patch()
+        # Процессы делят ядра между собой, иначе потоки torch конкурируют друг с другом
+        torch.set_num_threads(threads)
+        _worker_vpr = VPRSystem()
+    except Exception as e:
+        # Исключение в initializer пул не передаёт, а бесконечно перезапускает процесс,
+        # поэтому ошибка сохраняется и выбрасывается из первой же задачи
+        _worker_error = f"{type(e).__name__}: {e}"
+
+
+def _embed_chunk(task: Tuple[int, List[str], str, int]) -> Tuple[int, int, int]:
+    """
+    Вычисляет дескрипторы одного чанка изображений и атомарно записывает их в файл.
+    Изображения декодируются порциями по batch_size, так что в памяти процесса
+    одновременно находится один батч, а не весь чанк в полном разрешении.
+    Нечитаемые изображения пропускаются; в файле сохраняются номера строк чанка,
+    для которых дескриптор получен.
+
+    :return: (номер чанка, изображений в чанке, получено дескрипторов)
+    """
+    chunk_id, paths, chunk_path, batch_size = task
+    if _worker_vpr is None:
+        raise RuntimeError(f"Не удалось загрузить модель в процессе-обработчике: {_worker_error}")
+
+    rows, batches = [], []
+    for start in range(0, len(paths), batch_size):
+        images = []
+        for row in range(start, min(start + batch_size, len(paths))):
+            try:
+                with Image.open(paths[row]) as img:
+                    images.append(img.convert("RGB"))
+                rows.append(row)
+            except Exception as e:
+                print(f"⚠️ Пропуск изображения {paths[row]}: {e}")
+        if images:
+            batches.append(_worker_vpr.embed(images, batch_size))
+
+    descs = np.vstack(batches) if batches else np.empty((0, _worker_vpr.index.d), dtype="float32")
+
+    tmp_path = f"{chunk_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, descs=descs, rows=np.array(rows, dtype="int64"),
+                 fingerprint=np.array(_worker_vpr.model_fingerprint))
+    os.replace(tmp_path, chunk_path)
+    return chunk_id, len(paths), len(rows)
+
+
+def _prepare_work_dir(work_dir: str, plan: Dict[str, Any], restart: bool) -> None:
+    """
+    Создаёт рабочий каталог с планом построения. Если каталог остался от прерванного
+    запуска с тем же планом, готовые чанки переиспользуются; при другом плане
+    (изменился каталог сцен или размер чанка) требуется явный restart.
+    """
+    plan_path = os.path.join(work_dir, PLAN_FILE)
+    if restart:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if os.path.exists(plan_path):
+        with open(plan_path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous != plan:
+            raise ValueError(
+                f"Рабочий каталог {work_dir} относится к другому набору изображений "
+                f"или размеру чанка; запустите построение с --restart"
+            )
+        return
+
+    os.makedirs(work_dir, exist_ok=True)
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+
+
+def _scene_metadata(entries: List[Dict[str, Any]], scene_ids: List[str]) -> List[SceneMetadata]:
+    first_entry = {}
+    for entry in entries:
+        first_entry.setdefault(entry["scene_id"], entry)
+    return [
+        SceneMetadata(
+            scene_id=scene_id,
+            title=first_entry[scene_id].get("title", ""),
+            description=first_entry[scene_id].get("description", ""),
+            latitude=first_entry[scene_id].get("lat", 0.0),
+            longitude=first_entry[scene_id].get("lon", 0.0),
+        )
+        for scene_id in scene_ids
+    ]
+
+
+def _merge_chunks(entries: List[Dict[str, Any]], work_dir: str, chunks: int,
+                  chunk_size: int) -> Tuple[np.ndarray, List[str], str]:
+    """
+    Объединяет чанки в одну матрицу дескрипторов. Матрица собирается в файле,
+    отображённом в память, поэтому каталог может превышать объём RAM.
+
+    :return: (дескрипторы, отображение дескриптор -> сцена, отпечаток модели)
+    """
+    parts, fingerprints, dim = [], set(), 0
+    for chunk_id in range(chunks):
+        with np.load(os.path.join(work_dir, CHUNK_FILE_TEMPLATE.format(chunk_id))) as data:
+            parts.append(chunk_id * chunk_size + data["rows"])
+            fingerprints.add(str(data["fingerprint"]))
+            dim = dim or data["descs"].shape[1]
+
+    if len(fingerprints) > 1:
+        raise ValueError(
+            f"Чанки построены разными моделями ({', '.join(sorted(fingerprints))}); "
+            f"запустите построение с --restart"
+        )
+
+    valid_rows = np.concatenate(parts)
+    merged = np.lib.format.open_memmap(os.path.join(work_dir, MERGED_FILE), mode="w+",
+                                       dtype="float32", shape=(len(valid_rows), dim))
+    offset = 0
+    for chunk_id in range(chunks):
+        with np.load(os.path.join(work_dir, CHUNK_FILE_TEMPLATE.format(chunk_id))) as data:
+            descs = data["descs"]
+            merged[offset:offset + len(descs)] = descs
+            offset += len(descs)
+
+    descriptor_to_scene = [entries[row]["scene_id"] for row in valid_rows]
+    return merged, descriptor_to_scene, fingerprints.pop()
+
+
+def _consolidate(descs: np.ndarray, descriptor_to_scene: List[str],
+                 max_per_scene: int) -> Tuple[np.ndarray, List[str]]:
+    """Оставляет не более max_per_scene медоидов на сцену (дескрипторы сцены идут подряд)."""
+    keep, start = [], 0
+    while start < len(descriptor_to_scene):
+        end = start
+        while end < len(descriptor_to_scene) and descriptor_to_scene[end] == descriptor_to_scene[start]:
+            end += 1
+        keep.extend(start + select_representatives(descs[start:end], max_per_scene))
+        start = end
+
+    keep = np.array(keep, dtype="int64")
+    print(f"🗜 Консолидация: {len(descs)} -> {len(keep)} дескрипторов (не более {max_per_scene} на сцену)")
+    return descs[keep], [descriptor_to_scene[i] for i in keep]
+
+
+def build_index_artifact(entries: List[Dict[str, Any]], output: str, workers: int = 2,
+                         chunk_size: int = 256, batch_size: int = 16, max_per_scene: int = 0,
+                         work_dir: Optional[str] = None, restart: bool = False,
+                         keep_parts: bool = False) -> Dict[str, Any]:
+    """
+    Строит артефакт индекса вне сервера, параллельно в нескольких процессах.
+
+    Изображения упорядочиваются по сцене и пути и делятся на чанки по chunk_size.
+    Каждый чанк обрабатывается отдельным процессом и сохраняется в рабочий каталог
+    (по умолчанию <output>.parts); повторный запуск пропускает готовые чанки.
+    После обработки всех чанков они объединяются в артефакт формата
+    save_index_artifact, который сервер подключает при INDEX_MODE=shared или artifact.
+
+    :param max_per_scene: консолидация дескрипторов сцены (0 — без консолидации).
+                          Исходные дескрипторы в артефакт не попадают, поэтому
+                          переранжирование на сервере для такого индекса не выполняется
+    :return: манифест артефакта
+    """
+    started = time.perf_counter()
+    entries = sorted(entries, key=lambda entry: (entry["scene_id"], entry["path"]))
+    if not entries:
+        raise ValueError("Нет изображений для построения индекса")
+
+    chunks = (len(entries) + chunk_size - 1) // chunk_size
+    work_dir = work_dir or f"{output.rstrip(os.sep)}.parts"
+    digest = entries_digest(entries)
+    plan = {"entries": len(entries), "digest": digest, "chunk_size": chunk_size}
+    _prepare_work_dir(work_dir, plan, restart)
+
+    tasks = [
+        (chunk_id, [entry["path"] for entry in entries[chunk_id * chunk_size:(chunk_id + 1) * chunk_size]],
+         os.path.join(work_dir, CHUNK_FILE_TEMPLATE.format(chunk_id)), batch_size)
+        for chunk_id in range(chunks)
+    ]
+    pending = [task for task in tasks if not os.path.exists(task[2])]
+    print(f"🧱 Чанков: {chunks}, готово ранее: {chunks - len(pending)}, процессов: {workers}")
+
+    if pending:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(min(workers, len(pending)), initializer=_init_worker, initargs=(threads,)) as pool:
+            for done, (chunk_id, total, embedded) in enumerate(pool.imap_unordered(_embed_chunk, pending), 1):
+                print(f"🧱 Чанк {chunk_id} готов ({embedded}/{total} изображений), {done}/{len(pending)}")
+
+    descs, descriptor_to_scene, fingerprint = _merge_chunks(entries, work_dir, chunks, chunk_size)
+    if max_per_scene > 0:
+        descs, descriptor_to_scene = _consolidate(descs, descriptor_to_scene, max_per_scene)
+
+    scene_ids = list(dict.fromkeys(descriptor_to_scene))
+    with artifact_lock(output):
+        manifest = save_index_artifact(
+            output, descs, descriptor_to_scene, _scene_metadata(entries, scene_ids),
+            extra={
+                "model_fingerprint": fingerprint,
+                "entries_digest": digest,
+                "images": len(entries),
+                "max_per_scene": max_per_scene,
+                "build_sec": round(time.perf_counter() - started, 1),
+            },
+        )
+
+    del descs
+    if not keep_parts:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return manifest
@@ -0,0 +1,485 @@
+import argparse
+import hashlib
+import os
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import faiss
+import numpy as np
+
+# Размер порции при переносе дескрипторов между шардами
+TRANSFER_CHUNK = 4096
+
+# Локальный шард запускается как модуль: python -m app.usecase.vpr.sharding
+SHARD_MODULE = "app.usecase.vpr.sharding"
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+SHARD_START_TIMEOUT = 60
+
+SHARD_BUSY_ERROR = "шард уже обслуживает другого координатора"
+
+
+def assign_shard(scene_id: str, shards: int) -> int:
+    """
+    Детерминированно выбирает шард для сцены (rendezvous hashing).
+
+    Все дескрипторы сцены попадают в один шард. При изменении числа шардов
+    переезжают только сцены, у которых сменился шард-победитель (~1/N сцен).
+    """
+    def weight(shard: int) -> int:
+        digest = hashlib.blake2b(f"{scene_id}:{shard}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    return max(range(shards), key=weight)
+
+
+def parse_shard_addresses(value: str) -> List[Tuple[str, int]]:
+    """Разбирает список адресов шардов вида "host1:port1,host2:port2"."""
+    addresses = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        host, _, port = item.rpartition(":")
+        addresses.append((host or "localhost", int(port)))
+    return addresses
+
+
+def _empty_result(rows: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    return np.full((rows, k), np.inf, dtype="float32"), np.full((rows, k), -1, dtype="int64")
+
+
+def _shard_loop(conn: Connection) -> None:
+    """
+    Цикл обработки команд одного шарда. Протокол — кортежи (команда, *аргументы):
+
+    - ("init", dim) — создать пустой индекс размерности dim (первая команда сессии);
+    - ("add", ids, descs, scene_ids) — добавить дескрипторы с глобальными идентификаторами;
+    - ("search", queries, k, candidate_ids) — вернуть (distances, global_ids);
+    - ("take", scene_ids) — удалить и вернуть дескрипторы указанных сцен;
+    - ("export",) — вернуть все дескрипторы шарда;
+    - ("reset",), ("stats",), ("close",).
+
+    Ответ — ("ok", результат) или ("error", сообщение).
+    """
+    dim = 0
+    index = None
+    id_to_scene: Dict[int, str] = {}
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+
+        command, args = request[0], request[1:]
+        try:
+            if command == "init":
+                dim = args[0]
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+                id_to_scene.clear()
+                result = dim
+            elif command == "close":
+                conn.send(("ok", None))
+                break
+            elif index is None:
+                raise RuntimeError("Шард не инициализирован")
+            elif command == "add":
+                ids, descs, scene_ids = args
+                index.add_with_ids(descs, ids)
+                id_to_scene.update(zip(ids.tolist(), scene_ids))
+                result = index.ntotal
+            elif command == "search":
+                queries, k, candidate_ids = args
+                if index.ntotal == 0:
+                    result = _empty_result(len(queries), k)
+                elif candidate_ids is None:
+                    result = index.search(queries, k)
+                else:
+                    selector = faiss.IDSelectorBatch(len(candidate_ids), faiss.swig_ptr(candidate_ids))
+                    result = index.search(queries, k, params=faiss.SearchParameters(sel=selector))
+            elif command == "take":
+                scene_ids = set(args[0])
+                ids = np.array([i for i, scene in id_to_scene.items() if scene in scene_ids], dtype="int64")
+                descs = np.vstack([index.reconstruct(int(i)) for i in ids]) if len(ids) else \
+                    np.empty((0, dim), dtype="float32")
+                scenes = [id_to_scene.pop(int(i)) for i in ids]
+                if len(ids):
+                    index.remove_ids(ids)
+                result = (ids, descs, scenes)
+            elif command == "export":
+                ids = np.array(sorted(id_to_scene), dtype="int64")
+                descs = np.vstack([index.reconstruct(int(i)) for i in ids]) if len(ids) else \
+                    np.empty((0, dim), dtype="float32")
+                result = (ids, descs)
+            elif command == "reset":
+                index.reset()
+                id_to_scene.clear()
+                result = 0
+            elif command == "stats":
+                result = {"ntotal": index.ntotal, "scenes": len(set(id_to_scene.values()))}
+            else:
+                raise ValueError(f"Неизвестная команда шарда: {command}")
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", str(e) or repr(e)))
+
+    conn.close()
+
+
+def _require_authkey(authkey: bytes) -> None:
+    """
+    Без ключа Listener не проверяет подключения: любой узел, которому доступен порт,
+    смог бы отправить шарду произвольные pickle-команды. Поэтому пустой ключ запрещён.
+    """
+    if not authkey:
+        raise ValueError("Не задан ключ шарда (INDEX_SHARD_AUTHKEY): без него шард доступен без аутентификации")
+
+
+def _reject(conn: Connection) -> None:
+    """Отвечает ошибкой на первую команду лишнего координатора."""
+    try:
+        conn.recv()
+        conn.send(("error", SHARD_BUSY_ERROR))
+    except (EOFError, OSError):
+        pass
+
+
+def serve_shard(address: Union[Tuple[str, int], str], authkey: bytes, once: bool = False) -> None:
+    """
+    Запускает шард как сервис: на другом узле (address — host:port) или как
+    локальный процесс координатора (address — путь unix-сокета).
+
+    Шард принадлежит одному координатору: его команда init сбрасывает индекс,
+    поэтому два координатора (например, два воркера gunicorn) затирали бы данные
+    друг друга. Подключения принимаются параллельно, но пока координатор подключён,
+    остальные получают ошибку SHARD_BUSY_ERROR и отключаются. Шард освобождается,
+    когда соединение координатора закрывается. С удалёнными шардами
+    gunicorn.conf.py запускает один воркер.
+
+    :param once: обслужить одного координатора и завершиться (локальный шард)
+    """
+    _require_authkey(authkey)
+    owner = threading.Lock()
+
+    def handle(conn: Connection) -> None:
+        with conn:
+            if not owner.acquire(blocking=False):
+                _reject(conn)
+                return
+            try:
+                _shard_loop(conn)
+            finally:
+                owner.release()
+
+    with Listener(address, authkey=authkey) as listener:
+        if once:
+            with listener.accept() as conn:
+                _shard_loop(conn)
+            return
+
+        print(f"🧩 Шард индекса слушает {address[0]}:{address[1]}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                print(f"⚠️ Подключение к шарду отклонено: {e}")
+                continue
+            threading.Thread(target=handle, args=(conn,), name="vpr-shard-conn", daemon=True).start()
+
+
+class ShardConnection:
+    """
+    Соединение координатора с шардом: отправка команды и получение ответа раздельно.
+
+    На каждую отправленную команду должен быть прочитан ровно один ответ, иначе
+    он достанется следующей команде. call() выполняет обмен под блокировкой
+    соединения; раздельные send()/recv() вызывающий сериализует сам (ShardedIndex).
+    """
+    def __init__(self, conn: Connection, process: Optional[subprocess.Popen] = None,
+                 socket_dir: Optional[str] = None):
+        self._conn = conn
+        self._process = process
+        self._socket_dir = socket_dir
+        self._lock = threading.Lock()
+
+    @classmethod
+    def local(cls, dim: int) -> "ShardConnection":
+        """
+        Шард в отдельном локальном процессе, связь через unix-сокет.
+
+        Процесс запускается как модуль (python -m app.usecase.vpr.sharding), а не
+        через multiprocessing: spawn повторно импортирует __main__ родителя, то есть
+        main.py вместе с сервером и моделью, а fork унаследовал бы потоки и память torch.
+        """
+        socket_dir = tempfile.mkdtemp(prefix="vpr-shard-")
+        address = os.path.join(socket_dir, "shard.sock")
+        authkey = secrets.token_hex(16)
+        env = dict(os.environ, INDEX_SHARD_AUTHKEY=authkey,
+                   PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.environ.get("PYTHONPATH")])))
+        process = subprocess.Popen([sys.executable, "-m", SHARD_MODULE, "--listen", address, "--once"], env=env)
+
+        deadline = time.monotonic() + SHARD_START_TIMEOUT
+        while True:
+            try:
+                conn = Client(address, family="AF_UNIX", authkey=authkey.encode())
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if process.poll() is None and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    continue
+                process.kill()
+                process.wait()
+                shutil.rmtree(socket_dir, ignore_errors=True)
+                raise RuntimeError(f"Процесс шарда не запустился (код выхода {process.returncode})")
+
+        shard = cls(conn, process, socket_dir)
+        shard.call("init", dim)
+        return shard
+
+    @classmethod
+    def remote(cls, address: Tuple[str, int], authkey: bytes, dim: int) -> "ShardConnection":
+        """Шард на другом узле, запущенный через serve_shard()."""
+        _require_authkey(authkey)
+        shard = cls(Client(address, authkey=authkey))
+        try:
+            shard.call("init", dim)
+        except RuntimeError:
+            shard._conn.close()
+            raise
+        return shard
+
+    def send(self, *request) -> None:
+        self._conn.send(request)
+
+    def recv_reply(self) -> Tuple[str, object]:
+        """Читает ответ шарда как (статус, результат); обрыв соединения — тоже ответ "error"."""
+        try:
+            return self._conn.recv()
+        except (EOFError, OSError) as e:
+            return "error", f"соединение с шардом потеряно ({e.__class__.__name__})"
+
+    def recv(self):
+        status, result = self.recv_reply()
+        if status != "ok":
+            raise RuntimeError(f"Ошибка шарда: {result}")
+        return result
+
+    def call(self, *request):
+        with self._lock:
+            self.send(*request)
+            return self.recv()
+
+    def close(self) -> None:
+        try:
+            self.call("close")
+        except (EOFError, OSError, RuntimeError):
+            pass
+        self._conn.close()
+        if self._process is not None:
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+
+
+class ShardedIndex:
+    """
+    Индекс, распределённый по N шардам (локальные процессы или удалённые узлы).
+
+    Дескрипторы распределяются по сценам через assign_shard, глобальные
+    идентификаторы назначаются координатором последовательно, как в FlatIndex.
+    Поиск рассылается во все шарды параллельно, а их top-k объединяются.
+
+    Операции сериализуются блокировкой индекса: обмен с шардами идёт по одному
+    соединению на шард, и параллельные запросы перепутали бы ответы.
+    """
+    def __init__(self, dim: int, shards: Sequence[ShardConnection]):
+        if not shards:
+            raise ValueError("Нужен хотя бы один шард")
+        self._lock = threading.RLock()
+        self._dim = dim
+        self._shards: List[ShardConnection] = list(shards)
+        self._ntotal = 0
+        self._scene_shard: Dict[str, int] = {}
+
+    @classmethod
+    def local(cls, dim: int, shards: int) -> "ShardedIndex":
+        return cls(dim, [ShardConnection.local(dim) for _ in range(shards)])
+
+    @classmethod
+    def remote(cls, dim: int, addresses: Sequence[Tuple[str, int]], authkey: bytes) -> "ShardedIndex":
+        return cls(dim, [ShardConnection.remote(address, authkey, dim) for address in addresses])
+
+    @property
+    def d(self) -> int:
+        return self._dim
+
+    @property
+    def ntotal(self) -> int:
+        return self._ntotal
+
+    @property
+    def shard_count(self) -> int:
+        return len(self._shards)
+
+    def _exchange(self, requests: List[Tuple[ShardConnection, tuple]]) -> list:
+        """
+        Отправляет шардам их команды и только затем собирает ответы — шарды работают
+        параллельно. Ответы читаются у всех шардов, получивших команду, даже если
+        какой-то из них вернул ошибку: иначе непрочитанный ответ достался бы следующей команде.
+        """
+        sent, errors = [], []
+        for shard, request in requests:
+            try:
+                shard.send(*request)
+                sent.append(shard)
+            except (OSError, ValueError) as e:
+                errors.append(f"отправка команды не удалась ({e})")
+
+        results = []
+        for shard in sent:
+            status, result = shard.recv_reply()
+            if status == "ok":
+                results.append(result)
+            else:
+                errors.append(result)
+        if errors:
+            raise RuntimeError(f"Ошибка шарда: {'; '.join(map(str, errors))}")
+        return results
+
+    def _broadcast(self, *request) -> list:
+        return self._exchange([(shard, request) for shard in self._shards])
+
+    def add(self, descs: np.ndarray, scene_ids: Optional[List[str]] = None) -> None:
+        if scene_ids is None or len(scene_ids) != len(descs):
+            raise ValueError("Для шардированного индекса нужны scene_ids каждого дескриптора")
+
+        with self._lock:
+            ids = np.arange(self._ntotal, self._ntotal + len(descs), dtype="int64")
+            self._ntotal += len(descs)
+            self._add_to_shards(ids, np.ascontiguousarray(descs, dtype="float32"), list(scene_ids))
+
+    def _add_to_shards(self, ids: np.ndarray, descs: np.ndarray, scene_ids: List[str]) -> None:
+        groups: Dict[int, List[int]] = {}
+        for row, scene_id in enumerate(scene_ids):
+            shard = self._scene_shard.setdefault(scene_id, assign_shard(scene_id, len(self._shards)))
+            groups.setdefault(shard, []).append(row)
+
+        self._exchange([
+            (self._shards[shard], ("add", ids[rows], descs[rows], [scene_ids[r] for r in rows]))
+            for shard, rows in groups.items()
+        ])
+
+    def search(self, queries: np.ndarray, k: int,
+               candidate_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Рассылает запрос во все шарды и объединяет их локальные top-k в общий top-k.
+        Каждый шард применяет candidate_ids к своей части дескрипторов.
+        """
+        if candidate_ids is not None:
+            candidate_ids = np.ascontiguousarray(candidate_ids, dtype="int64")
+            if len(candidate_ids) == 0:
+                return _empty_result(len(queries), k)
+
+        with self._lock:
+            results = self._broadcast("search", queries, k, candidate_ids)
+        distances = np.hstack([d for d, _ in results])
+        ids = np.hstack([i for _, i in results])
+
+        # Пустые позиции шардов (id = -1) уходят в конец выдачи
+        distances = np.where(ids < 0, np.inf, distances)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return (np.take_along_axis(distances, order, axis=1).astype("float32"),
+                np.take_along_axis(ids, order, axis=1))
+
+    def descriptors(self) -> np.ndarray:
+        """Собирает все дескрипторы в порядке глобальных идентификаторов."""
+        with self._lock:
+            result = np.empty((self._ntotal, self._dim), dtype="float32")
+            for ids, descs in self._broadcast("export"):
+                result[ids] = descs
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._broadcast("reset")
+            self._ntotal = 0
+            self._scene_shard = {}
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return self._broadcast("stats")
+
+    def rebalance(self, shards: Sequence[ShardConnection]) -> int:
+        """
+        Переходит на новый набор шардов. Шарды, присутствующие и в старом наборе,
+        сохраняют свои данные; отсутствующие в новом наборе закрываются.
+        Переносятся только сцены, у которых по assign_shard сменился шард: при
+        добавлении шардов в конец списка это ~1/N сцен.
+
+        :return: количество перенесённых сцен
+        """
+        new_shards = list(shards)
+        if not new_shards:
+            raise ValueError("Нужен хотя бы один шард")
+        with self._lock:
+            moves: Dict[int, List[str]] = {}
+            new_assignment = {}
+            for scene_id, old_shard in self._scene_shard.items():
+                new_shard = assign_shard(scene_id, len(new_shards))
+                new_assignment[scene_id] = new_shard
+                if new_shards[new_shard] is not self._shards[old_shard]:
+                    moves.setdefault(old_shard, []).append(scene_id)
+
+            taken = [self._shards[shard].call("take", scene_ids) for shard, scene_ids in moves.items()]
+
+            for shard in self._shards:
+                if not any(shard is kept for kept in new_shards):
+                    shard.close()
+
+            old_count = len(self._shards)
+            self._shards = new_shards
+            self._scene_shard = new_assignment
+
+            for ids, descs, scene_ids in taken:
+                for start in range(0, len(ids), TRANSFER_CHUNK):
+                    end = start + TRANSFER_CHUNK
+                    self._add_to_shards(ids[start:end], descs[start:end], scene_ids[start:end])
+
+            moved = sum(len(scene_ids) for scene_ids in moves.values())
+            print(f"🧩 Перебалансировка {old_count} -> {len(new_shards)} шардов: перенесено сцен {moved}")
+            return moved
+
+    def resize(self, shards: int) -> int:
+        """Меняет число локальных шардов: лишние с конца закрываются, новые добавляются в конец."""
+        with self._lock:
+            kept = self._shards[:shards]
+            return self.rebalance(kept + [ShardConnection.local(self._dim) for _ in range(shards - len(kept))])
+
+    def close(self) -> None:
+        with self._lock:
+            for shard in self._shards:
+                shard.close()
+            self._shards = []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Удалённый шард индекса VPR")
+    parser.add_argument("--listen", default="127.0.0.1:7100",
+                        help="Адрес host:port или путь unix-сокета (для доступа с других узлов — 0.0.0.0:7100)")
+    parser.add_argument("--authkey", default=os.getenv("INDEX_SHARD_AUTHKEY", ""),
+                        help="Общий ключ с координатором, обязателен (по умолчанию INDEX_SHARD_AUTHKEY)")
+    parser.add_argument("--once", action="store_true", help="Завершиться после отключения координатора")
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error("нужен ключ шарда: --authkey или INDEX_SHARD_AUTHKEY")
+    address = args.listen if os.sep in args.listen else parse_shard_addresses(args.listen)[0]
+    serve_shard(address, args.authkey.encode(), once=args.once)
@@ -1,20 +1,35 @@
-from typing import List, Dict, Any, Optional
+import hashlib
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from PIL import Image
 import numpy as np
-import faiss
 import torch
 from torchvision import transforms
 
 from app.usecase.mega_loc.model import MegaLoc
 from app.usecase.storage.storage import Storage
+from app.usecase.vpr.index import FlatIndex, MmapFlatIndex
+from app.usecase.vpr.sharding import ShardedIndex, parse_shard_addresses
+from app.usecase.vpr.consolidation import select_representatives
+from app.usecase.vpr.artifact import save_index_artifact, load_index_artifact
+from app.usecase.geo.spatial_index import GridSpatialIndex
+from app.usecase.cache.cache import TTLCache, perceptual_hash
+from app.usecase.metrics.metrics import timed
 from ...domain.model import PlaceRecognizeResult, SceneMetadata
 from app.config.config import CONFIG, IMAGE_SIZE
 
+# Размер порции при раздаче дескрипторов артефакта по шардам
+ARTIFACT_SHARD_CHUNK = 4096
+
 
 class VPRSystem:
     def __init__(self):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = MegaLoc().to(self.device)
+
+        # Веса не загружаются, поэтому инициализация фиксируется seed'ом: иначе каждый
+        # процесс получил бы свою модель и не смог бы использовать чужой индекс
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(CONFIG["model"]["seed"])
+            self.model = MegaLoc(hub_dir=CONFIG["model"]["dinov2_hub_dir"] or None).to(self.device)
         self.model.eval()
 
         self.transform = transforms.Compose([
@@ -24,38 +39,143 @@ class VPRSystem:
             transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
         ])
 
-        # Вычисляем размерность выходного дескриптора
+        # Вычисляем размерность выходного дескриптора и отпечаток модели,
+        # по которому проверяется совместимость сохранённых индексов
         with torch.no_grad():
             dummy = torch.zeros(1, 3, IMAGE_SIZE, IMAGE_SIZE).to(self.device)
-            output_dim = self.model(dummy).shape[1]
+            dummy_desc = self.model(dummy).cpu().numpy()
+            output_dim = dummy_desc.shape[1]
+        self.model_fingerprint = hashlib.sha1(np.round(dummy_desc, 3).tobytes()).hexdigest()[:16]
 
         redis_cfg = CONFIG["redis"]
-        self.index = faiss.IndexFlatL2(output_dim)
+        # Шарды создаются только при построении индекса (_create_index), чтобы
+        # процессы-шарды не порождались в мастер-процессе gunicorn до fork
+        self.index = FlatIndex(output_dim)
         self.storage = Storage(redis_cfg["host"], redis_cfg["port"])
-        self.storage.flush()
         self.descriptor_to_scene: List[str] = []
 
+        # Пространственный индекс сцен и обратное отображение сцена -> дескрипторы
+        self.spatial_index = GridSpatialIndex(CONFIG["geo"]["cell_deg"])
+        self.scene_to_descriptors: Dict[str, List[int]] = {}
+
+        # Исходные дескрипторы сцен консолидированного индекса для переранжирования;
+        # пусто, если индекс не консолидирован или подключён из артефакта
+        self.scene_originals: Dict[str, np.ndarray] = {}
+
+        # Версия индекса увеличивается при каждой его замене: по ней кэши
+        # результатов понимают, что сохранённые ответы устарели
+        self.index_version = 0
+
+        # Дескрипторы зависят только от кадра и модели, поэтому кэш эмбеддингов
+        # переживает перестроение индекса
+        cache_cfg = CONFIG["cache"]
+        self.embedding_cache = TTLCache("embedding", cache_cfg["embedding_size"], cache_cfg["embedding_ttl"])
+
+    @staticmethod
+    def _create_index(dim: int):
+        """Создаёт пустой индекс: локальный FlatIndex или распределённый по шардам."""
+        index_cfg = CONFIG["index"]
+        addresses = parse_shard_addresses(index_cfg["shard_addresses"])
+        if addresses:
+            print(f"🧩 Индекс распределяется по удалённым шардам: {len(addresses)}")
+            return ShardedIndex.remote(dim, addresses, index_cfg["shard_authkey"].encode())
+        if index_cfg["shards"] > 1:
+            print(f"🧩 Индекс распределяется по локальным шардам: {index_cfg['shards']}")
+            return ShardedIndex.local(dim, index_cfg["shards"])
+        return FlatIndex(dim)
+
+    def _replace_index(self):
+        dim = self.index.d
+        self.index.close()
+        self.index = self._create_index(dim)
+
+    def close(self):
+        """Освобождает ресурсы индекса (останавливает процессы-шарды)."""
+        self.index.close()
+
     def _process_image(self, image: Image.Image) -> np.ndarray:
-        tensor = self.transform(image).unsqueeze(0).to(self.device)
-        with torch.no_grad():
-            desc = self.model(tensor)
-        return desc.cpu().numpy().astype("float32")
+        return self._process_images([image])
+
+    def _process_images(self, images: List[Image.Image], batch_size: int = 16,
+                        use_cache: bool = True) -> np.ndarray:
+        """
+        Вычисляет дескрипторы изображений батчами размера batch_size.
+
+        Дескрипторы кадров, уже встречавшихся ранее (совпадает перцептивный хэш),
+        берутся из кэша эмбеддингов, и модель запускается только для остальных.
+        """
+        if not use_cache or not self.embedding_cache.enabled:
+            return self._infer(images, batch_size)
+
+        keys = [perceptual_hash(img) for img in images]
+        descs: List[Optional[np.ndarray]] = [self.embedding_cache.get(key) for key in keys]
+        missing = [i for i, desc in enumerate(descs) if desc is None]
+
+        if missing:
+            computed = self._infer([images[i] for i in missing], batch_size)
+            for i, desc in zip(missing, computed):
+                descs[i] = desc
+                # Копия: строка-представление держала бы в памяти весь массив батча
+                self.embedding_cache.put(keys[i], desc.copy())
+
+        return np.stack(descs)
+
+    def embed(self, images: List[Image.Image], batch_size: int = 16) -> np.ndarray:
+        """Вычисляет дескрипторы изображений без кэша (для офлайн-построения индекса)."""
+        return self._infer(images, batch_size)
+
+    def _infer(self, images: List[Image.Image], batch_size: int) -> np.ndarray:
+        descs = []
+        for i in range(0, len(images), batch_size):
+            with timed("inference"), torch.no_grad():
+                batch = torch.stack([self.transform(img) for img in images[i:i + batch_size]]).to(self.device)
+                descs.append(self.model(batch).cpu().numpy().astype("float32"))
+        return np.concatenate(descs)
 
     def _update_scene_metadata(self, scene_id: str, entry: Dict[str, Any]):
+        metadata = SceneMetadata(
+            scene_id=scene_id,
+            title=entry.get("title", ""),
+            description=entry.get("description", ""),
+            latitude=entry.get("lat", 0.0),
+            longitude=entry.get("lon", 0.0),
+        )
+        # Пространственный индекс у каждого процесса свой, а хранилище общее: сцену,
+        # уже записанную другим воркером, всё равно нужно добавить в свой индекс
+        self.spatial_index.add(scene_id, metadata.latitude, metadata.longitude)
         if not self.storage.scene_exists(scene_id):
-            metadata = SceneMetadata(
-                scene_id=scene_id,
-                title=entry.get("title", ""),
-                description=entry.get("description", ""),
-                latitude=entry.get("lat", 0.0),
-                longitude=entry.get("lon", 0.0),
-            )
             self.storage.set_scene_metadata(scene_id, metadata)
 
-    def build_index(self, entries: List[Dict[str, Any]], batch_size: int = 16):
+    def warmup(self, iterations: int = 2, batch_size: int = 16):
+        """
+        Прогоняет несколько холостых проходов модели и поиска, чтобы первый реальный
+        запрос не тратил время на одноразовые выделения памяти и инициализацию ядер.
+        """
+        dummy = Image.new("RGB", (IMAGE_SIZE, IMAGE_SIZE))
+        for _ in range(iterations):
+            self._process_images([dummy], use_cache=False)
+            queries = self._process_images([dummy] * batch_size, batch_size, use_cache=False)
+            if self.index.ntotal > 0:
+                self.index.search(queries[:1], 5)
+
+    def build_index(self, entries: List[Dict[str, Any]], batch_size: int = 16,
+                    on_progress: Optional[Callable[[int, int], None]] = None):
+        """
+        Строит индекс по изображениям сцен. Все дескрипторы сохраняются в хранилище;
+        при включённой консолидации (CONSOLIDATE_MAX_PER_SCENE > 0) в индекс
+        попадают только медоиды кластеров дескрипторов каждой сцены, а исходные
+        дескрипторы остаются в памяти процесса для переранжирования.
+        """
         self.storage.flush()
-        self.index.reset()
+        self._replace_index()
         self.descriptor_to_scene = []
+        self.spatial_index.clear()
+        self.scene_to_descriptors = {}
+        self.scene_originals = {}
+
+        max_per_scene = CONFIG["consolidation"]["max_per_scene"]
+        # При консолидации дескрипторы копятся по сценам и попадают в индекс в конце
+        pending: Dict[str, List[np.ndarray]] = {}
 
         for i in range(0, len(entries), batch_size):
             batch = entries[i:i + batch_size]
@@ -78,27 +198,192 @@ class VPRSystem:
                 batch_tensor = torch.cat(images).to(self.device)
                 descs = self.model(batch_tensor).cpu().numpy().astype("float32")
 
-                self.index.add(descs)
+            scene_ids = [entry["scene_id"] for entry in valid_entries]
+            if max_per_scene > 0:
+                for desc, scene_id in zip(descs, scene_ids):
+                    pending.setdefault(scene_id, []).append(desc)
+            else:
+                self._add_to_index(descs, scene_ids)
 
             for desc, entry in zip(descs, valid_entries):
                 scene_id = entry["scene_id"]
                 desc_id = str(self.storage.next_id(f"{scene_id}:counter"))
 
                 self.storage.set_descriptor(scene_id, desc_id, desc)
-                self.descriptor_to_scene.append(scene_id)
                 self._update_scene_metadata(scene_id, entry)
 
+            if on_progress is not None:
+                on_progress(min(i + batch_size, len(entries)), len(entries))
+
+        if pending:
+            total = sum(len(descs) for descs in pending.values())
+            for scene_id, scene_descs in pending.items():
+                scene_descs = np.stack(scene_descs)
+                keep = select_representatives(scene_descs, max_per_scene)
+                self._add_to_index(scene_descs[keep], [scene_id] * len(keep))
+                if CONFIG["consolidation"]["rerank"] and len(keep) < len(scene_descs):
+                    self.scene_originals[scene_id] = scene_descs
+            print(f"🗜 Консолидация: {total} -> {self.index.ntotal} дескрипторов "
+                  f"(не более {max_per_scene} на сцену)")
+
+        self.index_version += 1
         print(f"✅ Индекс построен: {self.index.ntotal} дескрипторов.")
 
-    def search(self, query_img: Image.Image, max_dist: float = 1.5) -> Optional[PlaceRecognizeResult]:
-        query = self._process_image(query_img)
+    def _add_to_index(self, descs: np.ndarray, scene_ids: List[str]):
+        self.index.add(descs, scene_ids)
+        for scene_id in scene_ids:
+            self.scene_to_descriptors.setdefault(scene_id, []).append(len(self.descriptor_to_scene))
+            self.descriptor_to_scene.append(scene_id)
+
+    def save_artifact(self, path: str, entries_digest: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Сохраняет построенный индекс и метаданные сцен как артефакт для других процессов.
+
+        :param entries_digest: отпечаток записей, по которым построен индекс (artifact.entries_digest)
+        """
+        scenes = [
+            metadata for metadata in map(self.storage.get_scene_metadata, self.scene_to_descriptors)
+            if metadata is not None
+        ]
+        return save_index_artifact(
+            path, self.index.descriptors(), self.descriptor_to_scene, scenes,
+            extra={"model_fingerprint": self.model_fingerprint, "entries_digest": entries_digest},
+        )
+
+    def attach_artifact(self, path: str):
+        """
+        Подключает индекс из артефакта вместо построения: дескрипторы отображаются
+        в память только для чтения, метаданные сцен записываются в хранилище.
+        При настроенных шардах дескрипторы артефакта распределяются по ним.
+        """
+        artifact = load_index_artifact(path)
+        if artifact.manifest["count"] and artifact.manifest["dim"] != self.index.d:
+            raise ValueError(
+                f"Размерность дескрипторов артефакта ({artifact.manifest['dim']}) "
+                f"не совпадает с моделью ({self.index.d})"
+            )
+        fingerprint = artifact.manifest.get("model_fingerprint")
+        if fingerprint and fingerprint != self.model_fingerprint:
+            raise ValueError(
+                f"Артефакт построен другой моделью ({fingerprint} != {self.model_fingerprint}), "
+                f"пересоберите индекс"
+            )
+
+        self.index.close()
+        self.index = self._create_index(self.index.d)
+        if isinstance(self.index, ShardedIndex):
+            for start in range(0, len(artifact.descriptors), ARTIFACT_SHARD_CHUNK):
+                end = start + ARTIFACT_SHARD_CHUNK
+                self.index.add(np.asarray(artifact.descriptors[start:end]),
+                               artifact.descriptor_to_scene[start:end])
+        else:
+            self.index = MmapFlatIndex(artifact.descriptors)
+        self.descriptor_to_scene = artifact.descriptor_to_scene
+        self.scene_to_descriptors = {}
+        self.scene_originals = {}
+        for desc_idx, scene_id in enumerate(self.descriptor_to_scene):
+            self.scene_to_descriptors.setdefault(scene_id, []).append(desc_idx)
+
+        self.spatial_index.clear()
+        for metadata in artifact.scenes:
+            self.storage.set_scene_metadata(metadata.scene_id, metadata)
+            self.spatial_index.add(metadata.scene_id, metadata.latitude, metadata.longitude)
+
+        self.index_version += 1
+        print(f"✅ Индекс подключён из артефакта: {self.index.ntotal} дескрипторов.")
+
+    def search(self, query_img: Image.Image, max_dist: float = 1.5,
+               location: Optional[Tuple[float, float]] = None,
+               radius_m: Optional[float] = None) -> Optional[PlaceRecognizeResult]:
+        return self.search_batch([query_img], max_dist, location=location, radius_m=radius_m)[0]
+
+    def search_batch(self, query_imgs: List[Image.Image], max_dist: float = 1.5, batch_size: int = 16,
+                     location: Optional[Tuple[float, float]] = None,
+                     radius_m: Optional[float] = None) -> List[Optional[PlaceRecognizeResult]]:
+        """
+        Ищет места для нескольких изображений: дескрипторы вычисляются батчами,
+        а поиск по индексу выполняется одним запросом для всех изображений.
+
+        Если задана примерная позиция клиента (location = (lat, lon)) и радиус в метрах,
+        поиск ограничивается дескрипторами сцен из этого радиуса.
+        """
+        if not query_imgs:
+            return []
+
+        candidate_ids = None
+        if location is not None and radius_m is not None:
+            candidate_ids = self.candidate_ids(location[0], location[1], radius_m)
+            if len(candidate_ids) == 0:
+                return [None] * len(query_imgs)
+
+        queries = self._process_images(query_imgs, batch_size)
 
         if self.index.ntotal == 0:
-            return None
+            return [None] * len(query_imgs)
+
+        with timed("faiss_search"):
+            distances, ids = self.index.search(queries, 5, candidate_ids)
+
+        if self.scene_originals:
+            distances, ids = self._rerank(queries, distances, ids)
+        return [self._resolve(dist_row, id_row, max_dist) for dist_row, id_row in zip(distances, ids)]
+
+    def _rerank(self, queries: np.ndarray, distances: np.ndarray,
+                ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Переранжирует выдачу консолидированного индекса по исходным дескрипторам.
+
+        Для каждой найденной сцены расстояние заменяется минимальным расстоянием
+        до всех её исходных дескрипторов (scene_originals), после чего сцены
+        сортируются заново. Сцены, которые консолидация не сократила, сохраняют
+        расстояние из индекса: оно уже посчитано по всем их дескрипторам.
+        """
+        reranked_distances = np.full_like(distances, np.inf)
+        reranked_ids = np.full_like(ids, -1)
+
+        for row, (query, dist_row, id_row) in enumerate(zip(queries, distances, ids)):
+            best: Dict[str, Tuple[float, int]] = {}
+            for dist, idx in zip(dist_row, id_row):
+                if idx == -1 or idx >= len(self.descriptor_to_scene):
+                    continue
+                scene_id = self.descriptor_to_scene[idx]
+                if scene_id in best:
+                    continue
 
-        distances, ids = self.index.search(query, k=5)
+                scene_descs = self.scene_originals.get(scene_id)
+                if scene_descs is not None:
+                    # IndexFlatL2 возвращает квадрат расстояния, поэтому и здесь квадрат
+                    dist = float(np.min(np.sum((scene_descs - query) ** 2, axis=1)))
+                best[scene_id] = (dist, idx)
+
+            ranked = sorted(best.values())
+            for col, (dist, idx) in enumerate(ranked):
+                reranked_distances[row, col] = dist
+                reranked_ids[row, col] = idx
+
+        return reranked_distances, reranked_ids
+
+    def candidate_ids(self, lat: float, lon: float, radius_m: float) -> np.ndarray:
+        """Возвращает идентификаторы дескрипторов всех сцен в радиусе radius_m от точки."""
+        ids = [
+            desc_id
+            for scene_id, _ in self.spatial_index.query(lat, lon, radius_m)
+            for desc_id in self.scene_to_descriptors.get(scene_id, [])
+        ]
+        return np.array(ids, dtype="int64")
+
+    def scenes_near(self, lat: float, lon: float, radius_m: float) -> List[Tuple[SceneMetadata, float]]:
+        """Возвращает метаданные сцен в радиусе radius_m и расстояния до них в метрах."""
+        scenes = []
+        for scene_id, dist in self.spatial_index.query(lat, lon, radius_m):
+            metadata = self.storage.get_scene_metadata(scene_id)
+            if metadata is not None:
+                scenes.append((metadata, dist))
+        return scenes
 
-        for dist, idx in zip(distances[0], ids[0]):
+    def _resolve(self, distances: np.ndarray, ids: np.ndarray, max_dist: float) -> Optional[PlaceRecognizeResult]:
+        """Возвращает первого кандидата из выдачи FAISS, прошедшего порог и имеющего метаданные."""
+        for dist, idx in zip(distances, ids):
             if idx == -1 or idx >= len(self.descriptor_to_scene):
                 continue
             if dist > max_dist:
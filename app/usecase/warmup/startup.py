@@ -0,0 +1,72 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# --- Этапы запуска сервиса ---
+STAGE_PENDING = "pending"
+STAGE_LOADING_SCENES = "loading_scenes"
+STAGE_LOADING_MODEL = "loading_model"
+STAGE_BUILDING_INDEX = "building_index"
+STAGE_ATTACHING_INDEX = "attaching_index"
+STAGE_WARMUP = "warmup"
+STAGE_READY = "ready"
+STAGE_FAILED = "failed"
+
+
+class StartupState:
+    """
+    Состояние фоновой инициализации сервиса: текущий этап, прогресс этапа
+    и ошибка, если инициализация не удалась. Используется пробами готовности.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.stage = STAGE_PENDING
+        self.done = 0
+        self.total: Optional[int] = None
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def set_stage(self, stage: str, total: Optional[int] = None) -> None:
+        with self._lock:
+            self.stage = stage
+            self.done = 0
+            self.total = total
+        print(f"🚀 Запуск: {stage}")
+
+    def set_progress(self, done: int, total: Optional[int] = None) -> None:
+        with self._lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+
+    def mark_ready(self) -> None:
+        with self._lock:
+            self.stage = STAGE_READY
+            self.ready_at = time.time()
+        self._ready.set()
+        print(f"✅ Сервис готов за {self.ready_at - self.started_at:.1f} с")
+
+    def mark_failed(self, error: str) -> None:
+        with self._lock:
+            self.stage = STAGE_FAILED
+            self.error = error
+        print(f"❌ Ошибка запуска: {error}")
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "stage": self.stage,
+                "progress": {"done": self.done, "total": self.total},
+                "error": self.error,
+                "uptime_sec": round(time.time() - self.started_at, 1),
+            }
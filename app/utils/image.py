@@ -0,0 +1,22 @@
+from io import BytesIO
+
+from PIL import Image
+
+
+def bytes_to_image(data: bytes) -> Image.Image:
+    """
+    Декодирует изображение (JPEG, PNG и др.) из байтов в RGB-объект PIL.Image.
+
+    Args:
+        data: Содержимое файла изображения.
+
+    Returns:
+        PIL.Image.Image: Декодированное изображение в режиме RGB.
+
+    Raises:
+        ValueError: Если байты не удаётся распознать как изображение.
+    """
+    try:
+        return Image.open(BytesIO(data)).convert("RGB")
+    except Exception as e:
+        raise ValueError(f"Не удалось декодировать изображение: {e}")
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк производительности VPR/VPE на синтетических данных.
+
+Генерирует каталог сцен и видео заданного размера, после чего измеряет:
+- скорость построения индекса VPRSystem.build_index (изображений в секунду);
+- перцентили задержки VPRSystem.search (мс);
+- скорость VPEProcessor.process_video (кадров видео в секунду);
+- пиковое потребление памяти процессом (RSS, МБ).
+
+Запуск (из корня репозитория):
+    python -m bench.benchmark --scenes 50 --images-per-scene 4 --output bench_results.json
+    python -m bench.benchmark --baseline bench/baseline.json           # сравнение с эталоном
+    python -m bench.benchmark --baseline bench/baseline.json --save-baseline
+
+Веса модели не загружаются (MegaLoc инициализируется случайно). Для работы без сети
+код DINOv2 должен быть в кэше torch.hub или в локальной копии, указанной в DINOV2_HUB_DIR.
+По умолчанию используется RedisStub, чтобы не затирать данные реального Redis.
+Кэш эмбеддингов отключается (EMBEDDING_CACHE_SIZE=0): запросы поиска совпадают
+с проиндексированными изображениями, и с кэшем измерялись бы его попадания, а не модель.
+Код возврата 1 означает регрессию хотя бы одной метрики сверх допуска.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Направление «лучше» для каждой метрики: True — чем больше, тем лучше
+METRICS_HIGHER_IS_BETTER = {
+    "build_index_images_per_sec": True,
+    "search_latency_ms_p50": False,
+    "search_latency_ms_p95": False,
+    "search_latency_ms_p99": False,
+    "process_video_frames_per_sec": True,
+    "peak_rss_mb": False,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк VPR/VPE на синтетических данных")
+    parser.add_argument("--scenes", type=int, default=20, help="Количество сцен в каталоге")
+    parser.add_argument("--images-per-scene", type=int, default=3, help="Изображений на сцену")
+    parser.add_argument("--image-size", type=int, default=480, help="Размер синтетических изображений")
+    parser.add_argument("--queries", type=int, default=50, help="Количество запросов search")
+    parser.add_argument("--video-frames", type=int, default=300, help="Длина синтетического видео в кадрах")
+    parser.add_argument("--frame-step", type=int, default=30, help="Шаг выборки кадров VPEProcessor")
+    parser.add_argument("--seed", type=int, default=0, help="Seed генератора данных и модели")
+    parser.add_argument("--output", default="bench_results.json", help="Файл для результатов (JSON)")
+    parser.add_argument("--baseline", default=None, help="Эталонные результаты для сравнения (JSON)")
+    parser.add_argument("--save-baseline", action="store_true", help="Сохранить результаты как эталон")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Допустимое ухудшение (доля)")
+    parser.add_argument("--use-redis", action="store_true", help="Использовать Redis из конфигурации")
+    parser.add_argument("--workdir", default=None, help="Каталог для синтетических данных")
+    return parser.parse_args()
+
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return round(float(np.percentile(np.array(samples) * 1000, q)), 3)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(rss / divisor, 1)
+
+
+def run(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    import torch
+    from PIL import Image
+
+    from app.usecase.loader.scene_loader import load_scene_dataset, load_scene_metadata
+    from app.usecase.vpr.vpr import VPRSystem
+    from app.usecase.vpe.vpe import VPEProcessor
+    from bench.synthetic import generate_catalogue, generate_video
+
+    print(f"🧪 Генерация каталога: {args.scenes} сцен × {args.images_per_scene} изображений")
+    csv_path = generate_catalogue(workdir, args.scenes, args.images_per_scene, args.image_size, args.seed)
+    scenes_dir = os.path.join(workdir, "scenes")
+    entries = load_scene_dataset(scenes_dir, load_scene_metadata(csv_path))
+
+    scene_images = sorted(glob.glob(os.path.join(scenes_dir, "*", "0.jpg")))
+    video_path = generate_video(os.path.join(workdir, "video.mp4"), scene_images, args.video_frames,
+                                seed=args.seed)
+
+    started = time.perf_counter()
+    vpr = VPRSystem()
+    model_load_sec = time.perf_counter() - started
+
+    print("⏱ build_index")
+    started = time.perf_counter()
+    vpr.build_index(entries)
+    build_sec = time.perf_counter() - started
+
+    print("⏱ search")
+    rng = np.random.default_rng(args.seed)
+    query_paths = [entries[i]["path"] for i in rng.integers(0, len(entries), args.queries)]
+    query_images = [Image.open(path).convert("RGB") for path in query_paths]
+    vpr.search(query_images[0])  # прогрев
+
+    latencies = []
+    for img in query_images:
+        started = time.perf_counter()
+        vpr.search(img)
+        latencies.append(time.perf_counter() - started)
+
+    print("⏱ process_video")
+    processor = VPEProcessor(vpr, frame_step=args.frame_step, scenes_dir=scenes_dir)
+    started = time.perf_counter()
+    results = processor.process_video(video_path)
+    video_sec = time.perf_counter() - started
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "device": str(vpr.device),
+            "embedding_cache": vpr.embedding_cache.enabled,
+            "params": {
+                "scenes": args.scenes,
+                "images_per_scene": args.images_per_scene,
+                "image_size": args.image_size,
+                "queries": args.queries,
+                "video_frames": args.video_frames,
+                "frame_step": args.frame_step,
+                "seed": args.seed,
+            },
+        },
+        "metrics": {
+            "model_load_sec": round(model_load_sec, 3),
+            "build_index_images_per_sec": round(len(entries) / build_sec, 3),
+            "search_latency_ms_p50": percentile_ms(latencies, 50),
+            "search_latency_ms_p95": percentile_ms(latencies, 95),
+            "search_latency_ms_p99": percentile_ms(latencies, 99),
+            "process_video_frames_per_sec": round(args.video_frames / video_sec, 3),
+            "process_video_places": len(results),
+            "peak_rss_mb": peak_rss_mb(),
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Сравнивает метрики с эталоном и печатает таблицу.
+
+    Returns:
+        List[str]: Названия метрик, ухудшившихся больше чем на tolerance.
+    """
+    if current["meta"]["params"] != baseline["meta"]["params"]:
+        print("⚠️ Параметры запуска отличаются от эталона — сравнение может быть некорректным")
+
+    regressions = []
+    print(f"{'метрика':<32}{'эталон':>12}{'текущее':>12}{'изменение':>12}")
+    for name, higher_is_better in METRICS_HIGHER_IS_BETTER.items():
+        base = baseline["metrics"].get(name)
+        value = current["metrics"].get(name)
+        if not base or value is None:
+            continue
+
+        change = (value - base) / base
+        worse = -change if higher_is_better else change
+        mark = ""
+        if worse > tolerance:
+            regressions.append(name)
+            mark = " ❌"
+        print(f"{name:<32}{base:>12}{value:>12}{change:>+11.1%}{mark}")
+
+    return regressions
+
+
+def main() -> int:
+    args = parse_args()
+
+    if not args.use_redis:
+        # Заведомо закрытый порт: Storage сразу переключится на RedisStub
+        os.environ["REDIS_HOST"] = "127.0.0.1"
+        os.environ["REDIS_PORT"] = "1"
+    # Измеряется модель, а не попадания в кэш эмбеддингов
+    os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+    # Модель инициализируется из MODEL_SEED (VPRSystem), а не из глобального seed torch
+    os.environ["MODEL_SEED"] = str(args.seed)
+
+    from app.utils.env_patch import apply_openmp_patch
+    apply_openmp_patch()
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        report = run(args, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="vpr_bench_") as workdir:
+            report = run(args, workdir)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Результаты сохранены: {args.output}")
+    print(json.dumps(report["metrics"], ensure_ascii=False, indent=2))
+
+    if not args.baseline:
+        return 0
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ Эталон сохранён: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"⚠️ Эталон не найден: {args.baseline}")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print(f"❌ Регрессия метрик: {', '.join(regressions)}")
+        return 1
+
+    print("✅ Регрессий не обнаружено")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import csv
+import os
+from typing import List
+
+import cv2
+import numpy as np
+
+
+def _scene_pattern(rng: np.random.Generator, size: int) -> np.ndarray:
+    """
+    Генерирует «сцену» — случайный набор прямоугольников, окружностей и линий.
+    Такие изображения содержат достаточно углов для ORB, поэтому геометрическая
+    проверка проходит тот же путь, что и на реальных фотографиях.
+    """
+    img = np.full((size, size, 3), rng.integers(0, 255, 3), dtype=np.uint8)
+    for _ in range(40):
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        x1, y1, x2, y2 = (int(v) for v in rng.integers(0, size, 4))
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            cv2.rectangle(img, (x1, y1), (x2, y2), color, -1)
+        elif kind == 1:
+            cv2.circle(img, (x1, y1), int(rng.integers(5, size // 6)), color, -1)
+        else:
+            cv2.line(img, (x1, y1), (x2, y2), color, int(rng.integers(1, 6)))
+    return img
+
+
+def _viewpoint(rng: np.random.Generator, img: np.ndarray) -> np.ndarray:
+    """Имитирует другой ракурс той же сцены: небольшой поворот, масштаб и шум."""
+    size = img.shape[0]
+    angle = float(rng.uniform(-8, 8))
+    scale = float(rng.uniform(0.9, 1.1))
+    matrix = cv2.getRotationMatrix2D((size / 2, size / 2), angle, scale)
+    warped = cv2.warpAffine(img, matrix, (size, size), borderMode=cv2.BORDER_REFLECT)
+    noise = rng.normal(0, 6, warped.shape)
+    return np.clip(warped.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+def generate_catalogue(root: str, scenes: int, images_per_scene: int,
+                       size: int = 480, seed: int = 0) -> str:
+    """
+    Создаёт синтетический каталог сцен в формате data/: папки scenes/<scene_id>
+    с изображениями и scenes_metadata.csv с координатами вокруг центра Москвы.
+
+    Returns:
+        str: Путь к созданному CSV-файлу метаданных.
+    """
+    rng = np.random.default_rng(seed)
+    scenes_dir = os.path.join(root, "scenes")
+    csv_path = os.path.join(root, "scenes_metadata.csv")
+
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["scene_id", "title", "description", "lat", "lon"])
+
+        for i in range(scenes):
+            scene_id = f"scene_{i}"
+            scene_dir = os.path.join(scenes_dir, scene_id)
+            os.makedirs(scene_dir, exist_ok=True)
+
+            base = _scene_pattern(rng, size)
+            for j in range(images_per_scene):
+                cv2.imwrite(os.path.join(scene_dir, f"{j}.jpg"), _viewpoint(rng, base))
+
+            lat = 55.75 + float(rng.uniform(-0.2, 0.2))
+            lon = 37.62 + float(rng.uniform(-0.3, 0.3))
+            writer.writerow([scene_id, f"Сцена {i}", "Синтетическая сцена", f"{lat:.6f}", f"{lon:.6f}"])
+
+    return csv_path
+
+
+def generate_video(path: str, scene_images: List[str], frames: int,
+                   fps: int = 30, seed: int = 0) -> str:
+    """
+    Создаёт синтетическое видео: сцены каталога сменяют друг друга равными отрезками,
+    каждый кадр — новый «ракурс» текущей сцены.
+    """
+    rng = np.random.default_rng(seed)
+    first = cv2.imread(scene_images[0])
+    height, width = first.shape[:2]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError(f"Не удалось создать видеофайл: {path}")
+
+    try:
+        per_scene = max(1, frames // len(scene_images))
+        for i in range(frames):
+            scene = cv2.imread(scene_images[min(i // per_scene, len(scene_images) - 1)])
+            # cv2.imread возвращает BGR — _viewpoint не зависит от порядка каналов
+            writer.write(_viewpoint(rng, scene))
+    finally:
+        writer.release()
+
+    return path
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Офлайн-построение индекса сцен в артефакт, который подключает сервер.
+
+Изображения обрабатываются параллельно в нескольких процессах; прерванный запуск
+продолжается с готовых чанков при повторном вызове с теми же параметрами.
+
+Запуск (из корня репозитория):
+    python build_index.py --workers 8 --output data/index
+    python build_index.py --workers 8 --output data/index --restart   # начать заново
+
+Сервер подключает готовый артефакт при INDEX_MODE=artifact (только подключение)
+или INDEX_MODE=shared (подключение, а при отсутствии — построение) и
+INDEX_ARTIFACT_DIR, указывающем на каталог артефакта. Отпечаток модели
+в манифесте должен совпадать с моделью сервера (тот же MODEL_SEED и код DINOv2).
+"""
+
+import argparse
+import json
+import sys
+
+from app.utils.env_patch import apply_openmp_patch
+from app.usecase.loader.scene_loader import load_scene_dataset, load_scene_metadata
+from app.usecase.vpr.offline_builder import build_index_artifact
+from app.config.config import CONFIG
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Офлайн-построение артефакта индекса сцен")
+    parser.add_argument("--metadata", default=CONFIG["scenes_metadata_path"], help="CSV с метаданными сцен")
+    parser.add_argument("--scenes-dir", default=CONFIG["scenes_dir"], help="Каталог с папками сцен")
+    parser.add_argument("--output", default=CONFIG["index"]["artifact_dir"], help="Каталог артефакта")
+    parser.add_argument("--workers", type=int, default=2, help="Количество процессов")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Изображений в чанке")
+    parser.add_argument("--batch-size", type=int, default=16, help="Размер батча инференса")
+    parser.add_argument("--max-per-scene", type=int, default=CONFIG["consolidation"]["max_per_scene"],
+                        help="Консолидация: не более N дескрипторов на сцену (0 — выключена)")
+    parser.add_argument("--work-dir", default=None, help="Каталог чанков (по умолчанию <output>.parts)")
+    parser.add_argument("--restart", action="store_true", help="Удалить готовые чанки и начать заново")
+    parser.add_argument("--keep-parts", action="store_true", help="Не удалять чанки после сборки")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    apply_openmp_patch()
+
+    metadata = load_scene_metadata(args.metadata)
+    entries = load_scene_dataset(args.scenes_dir, metadata)
+    print(f"📁 Сцен в метаданных: {len(metadata)}, изображений: {len(entries)}")
+
+    manifest = build_index_artifact(
+        entries, args.output, workers=max(1, args.workers), chunk_size=max(1, args.chunk_size),
+        batch_size=args.batch_size, max_per_scene=args.max_per_scene, work_dir=args.work_dir,
+        restart=args.restart, keep_parts=args.keep_parts,
+    )
+    print(json.dumps(manifest, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
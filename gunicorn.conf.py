@@ -0,0 +1,20 @@
+# Конфигурация gunicorn для запуска нескольких воркеров:
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# Для экономии памяти используйте INDEX_MODE=shared (общий индекс через mmap)
+# и PRELOAD_MODEL=1 (веса модели загружаются до fork и разделяются воркерами).
+# Для больших каталогов индекс строится заранее (python build_index.py),
+# а сервер запускается с INDEX_MODE=artifact.
+# Удалённые шарды (INDEX_SHARD_ADDRESSES) обслуживают одного координатора,
+# поэтому с ними всегда запускается один воркер.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_WORKERS', '2'))
+if os.getenv('INDEX_SHARD_ADDRESSES', '').strip() and workers > 1:
+    # Второй воркер получил бы отказ шарда при init и никогда не стал бы готов
+    print(f"⚠️ Удалённые шарды обслуживают одного координатора: WEB_WORKERS={workers} -> 1")
+    workers = 1
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = os.getenv('PRELOAD_MODEL', '0') == '1'
+timeout = int(os.getenv('WEB_TIMEOUT', '300'))